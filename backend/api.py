@@ -1,19 +1,69 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import base64
+import json
+import mimetypes
+import hashlib
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
+import cv2
 import face_recognition
 import numpy as np
 
+import match
+from batching import BatchWriter
+
 load_dotenv()
 
+# dlib's FHOG/encoder SIMD paths are fixed at build time; make slow builds visible
+try:
+    import dlib
+    if not (getattr(dlib, "USE_AVX_INSTRUCTIONS", False) or getattr(dlib, "USE_NEON_INSTRUCTIONS", False)):
+        print("WARNING: dlib built without AVX/NEON - face encoding will be slow. See README backend build notes.")
+except ImportError:
+    pass
+
 app = Flask(__name__)
 CORS(app)
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024
 
+# orjson serializes the alert/face listings several times faster than stdlib json
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+except ImportError:
+    pass
+
+# Alert media types, registered explicitly so they don't depend on the host's mime.types
+mimetypes.add_type("video/mp4", ".mp4")
+mimetypes.add_type("image/jpeg", ".jpg")
+
 # Detection files directory
 DETECTIONS_DIR = os.path.join(os.path.dirname(__file__), "detections")
 
+# Behind nginx, hand media downloads off with X-Accel-Redirect. Needs:
+#   location /_protected/ { internal; alias /path/to/backend/detections/; }
+USE_XACCEL = os.getenv("USE_XACCEL", "").lower() in ("1", "true", "yes")
+XACCEL_PREFIX = os.getenv("XACCEL_PREFIX", "/_protected/")
+
 _supabase = None
 
 def get_supabase():
@@ -28,53 +78,333 @@ def get_supabase():
     return _supabase
 
 
+# InsightFace SCRFD detector: one ONNX pass instead of dlib's HOG sliding window.
+# Built once at import so requests never pay model load; falls back to HOG if missing.
+_face_app = None
+
+
+def load_face_detector():
+    """(Re)build the InsightFace detector; gunicorn calls this after fork"""
+    global _face_app
+    try:
+        from insightface.app import FaceAnalysis
+        face_app = FaceAnalysis(
+            name="buffalo_s",
+            allowed_modules=["detection"],
+            providers=["CPUExecutionProvider"],
+        )
+        face_app.prepare(ctx_id=-1, det_size=(320, 320))
+        _face_app = face_app
+    except Exception as e:
+        print(f"InsightFace unavailable, using HOG detection: {e}")
+        _face_app = None
+
+
+load_face_detector()
+
+
+def detect_face_locations(image, max_width=None, bgr=False):
+    """
+    Face boxes as (top, right, bottom, left) tuples, best detection first
+    Detection runs on a copy downscaled to max_width; boxes are mapped back
+    to full resolution so encoding still uses every pixel.
+    Pass bgr=True for OpenCV frames to skip a full-frame RGB conversion.
+    """
+    h, w = image.shape[:2]
+    scale = 1.0
+    small = image
+    if max_width and w > max_width:
+        scale = max_width / w
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    if _face_app is None:
+        # HOG only looks at intensity gradients; one channel is a third of the traffic
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY)
+        locations = face_recognition.face_locations(gray, model="hog")
+    else:
+        # InsightFace expects BGR input
+        faces = _face_app.get(small if bgr else np.ascontiguousarray(small[:, :, ::-1]))
+        locations = []
+        for face in faces:
+            x1, y1, x2, y2 = face.bbox.astype(int)
+            locations.append((y1, x2, y2, x1))
+
+    return [
+        (max(0, int(top / scale)), min(w, int(right / scale)),
+         min(h, int(bottom / scale)), max(0, int(left / scale)))
+        for top, right, bottom, left in locations
+    ]
+
+
+def encode_face_crop(bgr_frame, location, margin=0.25):
+    """
+    Encode one face from a BGR frame, converting only the face region to RGB
+    Returns the 128-d encoding or None
+    """
+    top, right, bottom, left = location
+    h, w = bgr_frame.shape[:2]
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    y1, y2 = max(0, top - pad_y), min(h, bottom + pad_y)
+    x1, x2 = max(0, left - pad_x), min(w, right + pad_x)
+
+    rgb_crop = cv2.cvtColor(bgr_frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(
+        rgb_crop, [(top - y1, right - x1, bottom - y1, left - x1)],
+        model=match.LANDMARK_MODEL,
+    )
+    return encodings[0] if encodings else None
+
+
+# Content-addressed cache of enrollment encodings (sha256 of detector, landmark
+# model and raw image bytes). In-process LRU in front of a SQLite file so retries
+# skip detection + encoding and the cache is shared by every worker on the host.
+# Kept out of DETECTIONS_DIR, which /api/alerts/media serves without auth.
+ENCODING_CACHE_DIR = os.getenv("ENCODING_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
+ENCODING_CACHE_PATH = os.path.join(ENCODING_CACHE_DIR, "encoding_cache.sqlite3")
+ENCODING_CACHE_SIZE = 512
+_encoding_cache = OrderedDict()
+_encoding_cache_lock = threading.Lock()
+
+# Earlier versions kept the cache in the public media folder
+try:
+    os.remove(os.path.join(DETECTIONS_DIR, "encoding_cache.sqlite3"))
+except OSError:
+    pass
+
+
+def _encoding_cache_db():
+    os.makedirs(ENCODING_CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(ENCODING_CACHE_PATH, timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS encodings ("
+        "key TEXT PRIMARY KEY, user_id TEXT NOT NULL, name TEXT NOT NULL, encoding TEXT NOT NULL)"
+    )
+    return conn
+
+
+def encoding_cache_key(raw):
+    """Cache key for uploaded bytes; changes with the detector or FACE_LANDMARK_MODEL"""
+    detector = "hog" if _face_app is None else "insightface"
+    h = hashlib.sha256(f"{detector}|{match.LANDMARK_MODEL}|".encode())
+    h.update(raw)
+    return h.hexdigest()
+
+
+def get_cached_encoding(key):
+    with _encoding_cache_lock:
+        if key in _encoding_cache:
+            _encoding_cache.move_to_end(key)
+            return _encoding_cache[key]
+
+    try:
+        with _encoding_cache_db() as conn:
+            row = conn.execute("SELECT encoding FROM encodings WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Encoding cache read failed: {e}")
+        return None
+    if row is None:
+        return None
+
+    encoding = json.loads(row[0])
+    _remember_encoding(key, encoding)
+    return encoding
+
+
+def cache_encoding(key, encoding, user_id, name):
+    _remember_encoding(key, encoding)
+    try:
+        with _encoding_cache_db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO encodings (key, user_id, name, encoding) VALUES (?, ?, ?, ?)",
+                (key, user_id, name, json.dumps(encoding)),
+            )
+    except sqlite3.Error as e:
+        print(f"Encoding cache write failed: {e}")
+
+
+def forget_cached_encodings(user_id, name):
+    """Drop cached enrollment encodings for a user's face name (the face was deleted)"""
+    with _encoding_cache_lock:
+        _encoding_cache.clear()
+    try:
+        with _encoding_cache_db() as conn:
+            conn.execute("DELETE FROM encodings WHERE user_id = ? AND name = ?", (user_id, name))
+    except sqlite3.Error as e:
+        print(f"Encoding cache delete failed: {e}")
+
+
+def _remember_encoding(key, encoding):
+    with _encoding_cache_lock:
+        _encoding_cache[key] = encoding
+        _encoding_cache.move_to_end(key)
+        while len(_encoding_cache) > ENCODING_CACHE_SIZE:
+            _encoding_cache.popitem(last=False)
+
+
+def read_upload_bytes(body):
+    """Raw image bytes from a multipart `image` upload or JSON `image_base64`"""
+    if "image" in request.files:
+        return request.files["image"].read()
+
+    b64 = body["image_base64"]
+    if "," in b64:
+        b64 = b64.split(",", 1)[1]
+    return base64.b64decode(b64)
+
+
+# Uploads decoded at half resolution must keep at least this many pixels per side
+MIN_REDUCED_SIDE = 480
+
+
+def decode_upload(raw):
+    """
+    Decode uploaded image bytes to a BGR array
+    Phone photos are decoded at half size inside libjpeg (DCT scaling),
+    which is far cheaper than a full decode; small images stay full-res.
+    """
+    nparr = np.frombuffer(raw, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_COLOR_2)
+    if image is None or min(image.shape[:2]) < MIN_REDUCED_SIDE:
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    return image
+
+
+def encode_upload(raw, user_id=None, name=None):
+    """
+    128-d encoding of the first face in an uploaded image
+    Returns (encoding, None) or (None, error message)
+    Enrollments (user_id and name given) go through the encoding cache;
+    match probes are never cached
+    """
+    cache_key = None
+    if user_id and name:
+        # The same bytes feed the cache key and the decoder
+        cache_key = encoding_cache_key(raw)
+        encoding = get_cached_encoding(cache_key)
+        if encoding is not None:
+            return encoding, None
+
+    image = decode_upload(raw)
+    if image is None:
+        return None, "Could not decode image"
+
+    locations = detect_face_locations(image, bgr=True)
+    if not locations:
+        return None, "No face detected"
+
+    encoding = encode_face_crop(image, locations[0])
+    if encoding is None:
+        return None, "Could not encode face"
+
+    encoding = encoding.tolist()
+    if cache_key is not None:
+        cache_encoding(cache_key, encoding, user_id, name)
+    return encoding, None
+
+
+# Per-user familiar-face matrices for the /api/faces/match fallback. Dropped when
+# this process adds or deletes that user's faces; the TTL bounds how long other
+# gunicorn workers can serve a stale set
+MATCH_TOLERANCE = 0.50
+FACE_MATRIX_TTL = 30  # seconds
+_face_matrices = {}  # user_id -> (matrix, names, time.monotonic() of the fetch)
+_face_matrices_lock = threading.Lock()
+
+
+def get_face_matrix(user_id):
+    """(float32 encoding matrix, names) for a user, cached for FACE_MATRIX_TTL"""
+    with _face_matrices_lock:
+        cached = _face_matrices.get(user_id)
+    if cached is not None and time.monotonic() - cached[2] < FACE_MATRIX_TTL:
+        return cached[0], cached[1]
+
+    sb = get_supabase()
+    r = sb.table("familiar_faces").select("name, encoding, encoding_bin").eq("user_id", user_id).execute()
+    rows = r.data or []
+    matrix, names = match.rows_to_matrix(rows), [row["name"] for row in rows]
+
+    with _face_matrices_lock:
+        _face_matrices[user_id] = (matrix, names, time.monotonic())
+    return matrix, names
+
+
+def invalidate_face_matrix(user_id):
+    with _face_matrices_lock:
+        _face_matrices.pop(user_id, None)
+
+
+# Enrollment rows are written by a background thread so handlers can respond
+# before the Supabase round-trip; rows queued close together share one insert.
+# A crash loses queued rows, which is acceptable for enrollment (user retries).
+FACE_INSERT_BATCH_SIZE = 50
+FACE_INSERT_BATCH_WINDOW = 0.1  # seconds
+
+
+def is_uuid(value):
+    """True if value parses as a UUID (familiar_faces.user_id references auth.users)"""
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def _insert_faces(batch):
+    try:
+        get_supabase().table("familiar_faces").insert(batch).execute()
+    except Exception as e:
+        print(f"Familiar face insert failed ({len(batch)} rows): {e}")
+        # One bad row fails the whole insert; retry row by row so only it is lost
+        if len(batch) > 1:
+            for row in batch:
+                try:
+                    get_supabase().table("familiar_faces").insert(row).execute()
+                except Exception as e:
+                    print(f"Dropped familiar face {row['name']!r} for user {row['user_id']}: {e}")
+
+    for user_id in {row["user_id"] for row in batch}:
+        invalidate_face_matrix(user_id)
+
+
+_face_inserts = BatchWriter(_insert_faces, FACE_INSERT_BATCH_SIZE, FACE_INSERT_BATCH_WINDOW)
+
+
+def queue_face_insert(row):
+    """Queue a familiar_faces row for a batched background insert"""
+    _face_inserts.put(row)
+
+
 @app.route("/api/faces", methods=["POST"])
 def add_face():
+    # Parse the JSON body once (oversized bodies are already rejected by MAX_CONTENT_LENGTH)
+    body = request.get_json(silent=True) or {}
     user_id = (
         request.headers.get("X-User-Id")
-        or (request.json.get("user_id") if request.is_json else None)
+        or body.get("user_id")
         or request.form.get("user_id")
     )
-    name = (
-        (request.json.get("name") if request.is_json else None)
-        or request.form.get("name")
-    )
+    name = body.get("name") or request.form.get("name")
     if not user_id or not name:
         return jsonify({"error": "user_id and name required"}), 400
+    if not is_uuid(user_id):
+        return jsonify({"error": "user_id must be a UUID"}), 400
 
-    if "image" not in request.files and not (request.is_json and request.json.get("image_base64")):
+    if "image" not in request.files and not body.get("image_base64"):
         return jsonify({"error": "image file or image_base64 required"}), 400
 
     try:
-        if "image" in request.files:
-            f = request.files["image"]
-            image = face_recognition.load_image_file(f)
-        else:
-            import base64
-            b64 = request.json["image_base64"]
-            if "," in b64:
-                b64 = b64.split(",", 1)[1]
-            raw = base64.b64decode(b64)
-            nparr = np.frombuffer(raw, np.uint8)
-            import cv2
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        locations = face_recognition.face_locations(image, model="hog")
-        if not locations:
-            return jsonify({"error": "No face detected"}), 400
-
-        encodings = face_recognition.face_encodings(image, locations, num_jitters=2)
-        if not encodings:
-            return jsonify({"error": "Could not encode face"}), 400
+        encoding, error = encode_upload(read_upload_bytes(body), user_id, name)
+        if encoding is None:
+            return jsonify({"error": error}), 400
 
-        encoding = encodings[0].tolist()
-        sb = get_supabase()
-        sb.table("familiar_faces").insert({
+        get_supabase()  # fail fast if Supabase isn't configured
+        queue_face_insert({
             "user_id": user_id,
             "name": name,
-            "encoding": encoding,
-        }).execute()
+            "encoding_bin": match.encoding_to_bytea(encoding),
+            "embedding": encoding,
+        })
 
         return jsonify({"ok": True, "name": name})
     except Exception as e:
@@ -95,6 +425,57 @@ def list_faces():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/faces/match", methods=["POST"])
+def match_face():
+    """
+    Identify the familiar face closest to an uploaded image.
+
+    Body: multipart `image` or JSON `image_base64`, plus user_id
+    """
+    body = request.get_json(silent=True) or {}
+    user_id = (
+        request.headers.get("X-User-Id")
+        or body.get("user_id")
+        or request.form.get("user_id")
+    )
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+
+    if "image" not in request.files and not body.get("image_base64"):
+        return jsonify({"error": "image file or image_base64 required"}), 400
+
+    try:
+        encoding, error = encode_upload(read_upload_bytes(body))
+        if encoding is None:
+            return jsonify({"error": error}), 400
+
+        # Nearest neighbour in Postgres (pgvector); scan locally if the RPC is unavailable
+        try:
+            result = get_supabase().rpc("match_familiar_face", {
+                "uid": user_id,
+                "probe": encoding,
+                "max_distance": MATCH_TOLERANCE,
+            }).execute()
+            best = result.data[0] if result.data else None
+            name, distance = (best["name"], best["distance"]) if best else (None, None)
+        except Exception as e:
+            print(f"match_familiar_face RPC failed, matching locally: {e}")
+            matrix, names = get_face_matrix(user_id)
+            best_idx, distance = match.nearest(matrix, encoding)
+            name = names[best_idx] if 0 <= best_idx and distance < MATCH_TOLERANCE else None
+
+        if name is None:
+            return jsonify({"match": None})
+
+        return jsonify({
+            "match": name,
+            "distance": distance,
+            "confidence": 1.0 - distance,
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/faces/<face_id>", methods=["DELETE"])
 def delete_face(face_id):
     user_id = request.headers.get("X-User-Id") or request.args.get("user_id")
@@ -103,7 +484,10 @@ def delete_face(face_id):
 
     try:
         sb = get_supabase()
-        sb.table("familiar_faces").delete().eq("id", face_id).eq("user_id", user_id).execute()
+        r = sb.table("familiar_faces").delete().eq("id", face_id).eq("user_id", user_id).execute()
+        invalidate_face_matrix(user_id)
+        for row in r.data or []:
+            forget_cached_encodings(user_id, row["name"])
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -114,6 +498,13 @@ def health():
     return jsonify({"ok": True})
 
 
+# Stream frames are downscaled to this width before face detection
+DETECTION_MAX_WIDTH = int(os.getenv("DETECTION_MAX_WIDTH", 640))
+
+# Give up on unreachable streams quickly instead of FFmpeg's ~30 s default
+STREAM_PROBE_TIMEOUT = 0.5
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "timeout;2000000|reconnect;1")
+
 # Default stream URL for remote capture
 DEFAULT_STREAM_URL = os.getenv(
     "VIDEO_STREAM_URL",
@@ -121,10 +512,34 @@ DEFAULT_STREAM_URL = os.getenv(
 )
 
 
+def probe_stream_url(url, timeout=STREAM_PROBE_TIMEOUT):
+    """
+    HEAD a stream URL without spinning up FFmpeg
+    Returns (reachable, content_type): reachable is True when the server answered,
+    False when the connection was refused or the host doesn't resolve, and None when
+    the probe was inconclusive (timeout, dropped connection); content_type is None
+    for error statuses and inconclusive probes
+    """
+    req = urllib.request.Request(url, method="HEAD")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return True, r.headers.get("Content-Type", "")
+    except urllib.error.HTTPError as e:
+        # Many MJPEG servers don't implement HEAD; the URL may still stream
+        if e.code in (405, 501):
+            return True, ""
+        return True, None
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, (ConnectionRefusedError, socket.gaierror)):
+            return False, None
+        return None, None
+    except Exception:
+        # Slow links (Tailscale relay, hotspot) can miss the probe timeout and still stream
+        return None, None
+
+
 def open_video_stream(stream_url):
     """Open video stream with proper configuration for remote HTTP streams"""
-    import cv2
-
     # Check if it's a local camera ID
     try:
         camera_id = int(stream_url)
@@ -134,23 +549,51 @@ def open_video_stream(stream_url):
     except (ValueError, TypeError):
         pass
 
-    # Try different backends for HTTP streams
+    # HTTP streams: probe the URL and its MJPEG variations with HEAD requests
+    # so only candidates that answer get a full FFmpeg open
     if str(stream_url).startswith(('http://', 'https://')):
-        cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
-        if not cap.isOpened():
-            cap = cv2.VideoCapture(stream_url)
+        variations = [
+            stream_url,
+            stream_url.rstrip('/') + '?action=stream',
+            stream_url.rstrip('/') + '/video',
+            stream_url.rstrip('/') + '/stream',
+        ]
+        cap = None
+        fallbacks = []
+        refused = False
+        for url in variations:
+            reachable, content_type = probe_stream_url(url)
+            if reachable is False:
+                refused = True
+                break  # host is down; no variation will do better
+            if reachable is None:
+                # Probe inconclusive: let FFmpeg (with its longer timeout) decide
+                cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+                if cap.isOpened():
+                    break
+                continue
+            if content_type is None:
+                continue
+            if any(t in content_type for t in ("video", "stream", "multipart")):
+                cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+                if cap.isOpened():
+                    break
+            else:
+                fallbacks.append(url)
 
-        if not cap.isOpened():
-            variations = [
-                stream_url,
-                stream_url.rstrip('/') + '?action=stream',
-                stream_url.rstrip('/') + '/video',
-                stream_url.rstrip('/') + '/stream',
-            ]
-            for url in variations:
-                cap = cv2.VideoCapture(url)
+        if cap is None or not cap.isOpened():
+            # Nothing advertised a video type; try the URLs that did answer
+            for url in fallbacks:
+                cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
                 if cap.isOpened():
                     break
+
+        if not refused and (cap is None or not cap.isOpened()):
+            # Last resort: OpenCV's default backend
+            cap = cv2.VideoCapture(stream_url)
+
+        if cap is None:
+            cap = cv2.VideoCapture()
     elif str(stream_url).startswith('rtsp://'):
         cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
     else:
@@ -175,17 +618,18 @@ def capture_face_from_stream():
         "stream_url": "optional - defaults to env VIDEO_STREAM_URL"
     }
     """
-    import cv2
-
+    body = request.get_json(silent=True) or {}
     user_id = (
         request.headers.get("X-User-Id")
-        or (request.json.get("user_id") if request.is_json else None)
+        or body.get("user_id")
     )
-    name = request.json.get("name") if request.is_json else None
-    stream_url = request.json.get("stream_url") if request.is_json else None
+    name = body.get("name")
+    stream_url = body.get("stream_url")
 
     if not user_id or not name:
         return jsonify({"error": "user_id and name required"}), 400
+    if not is_uuid(user_id):
+        return jsonify({"error": "user_id must be a UUID"}), 400
 
     if not stream_url:
         stream_url = DEFAULT_STREAM_URL
@@ -196,38 +640,37 @@ def capture_face_from_stream():
         if not cap.isOpened():
             return jsonify({"error": f"Cannot connect to stream: {stream_url}"}), 500
 
-        # Capture a few frames to let camera adjust
+        # Let the camera adjust; grab() skips decoding frames we throw away
         for _ in range(5):
-            cap.read()
+            cap.grab()
 
-        ret, frame = cap.read()
+        ret = cap.grab()
+        ret, frame = cap.retrieve() if ret else (False, None)
         cap.release()
 
         if not ret or frame is None:
             return jsonify({"error": "Failed to capture frame from stream"}), 500
 
-        # Convert BGR to RGB for face_recognition
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Detect face
-        locations = face_recognition.face_locations(rgb_frame, model="hog")
+        # Detect face on the BGR frame directly
+        locations = detect_face_locations(frame, max_width=DETECTION_MAX_WIDTH, bgr=True)
         if not locations:
             return jsonify({"error": "No face detected in stream. Position yourself in front of the camera."}), 400
 
-        # Encode face
-        encodings = face_recognition.face_encodings(rgb_frame, locations, num_jitters=2)
-        if not encodings:
+        # Encode face (only the face crop is converted to RGB)
+        encoding = encode_face_crop(frame, locations[0])
+        if encoding is None:
             return jsonify({"error": "Could not encode face"}), 400
 
-        encoding = encodings[0].tolist()
+        encoding = encoding.tolist()
 
         # Save to Supabase
-        sb = get_supabase()
-        sb.table("familiar_faces").insert({
+        get_supabase()
+        queue_face_insert({
             "user_id": user_id,
             "name": name,
-            "encoding": encoding,
-        }).execute()
+            "encoding_bin": match.encoding_to_bytea(encoding),
+            "embedding": encoding,
+        })
 
         return jsonify({"ok": True, "name": name, "message": "Face captured from stream and saved"})
 
@@ -238,8 +681,6 @@ def capture_face_from_stream():
 @app.route("/api/stream/test", methods=["GET"])
 def test_stream():
     """Test if the video stream is accessible"""
-    import cv2
-
     stream_url = request.args.get("url") or DEFAULT_STREAM_URL
 
     try:
@@ -308,16 +749,17 @@ def list_alerts():
 
         result = query.execute()
 
-        # Add full media URLs to each alert
+        # Add full media URLs to each alert (rows are fresh dicts, update in place)
         backend_url = os.getenv("EXPO_PUBLIC_BACKEND_URL", request.host_url.rstrip('/'))
-        alerts = []
-        for alert in (result.data or []):
-            alert_with_urls = dict(alert)
-            if alert.get("thumbnail_filename"):
-                alert_with_urls["thumbnail_url"] = f"{backend_url}/api/alerts/media/{alert['thumbnail_filename']}"
-            if alert.get("video_filename"):
-                alert_with_urls["video_url"] = f"{backend_url}/api/alerts/media/{alert['video_filename']}"
-            alerts.append(alert_with_urls)
+        prefix = f"{backend_url}/api/alerts/media/"
+        alerts = result.data or []
+        for alert in alerts:
+            thumbnail_filename = alert.get("thumbnail_filename")
+            if thumbnail_filename:
+                alert["thumbnail_url"] = prefix + thumbnail_filename
+            video_filename = alert.get("video_filename")
+            if video_filename:
+                alert["video_url"] = prefix + video_filename
 
         return jsonify({"alerts": alerts, "count": len(alerts)})
     except Exception as e:
@@ -404,14 +846,13 @@ def serve_alert_media(filename):
         return jsonify({"error": "File not found"}), 404
 
     # Determine MIME type
-    if filename.lower().endswith('.jpg') or filename.lower().endswith('.jpeg'):
-        mimetype = 'image/jpeg'
-    elif filename.lower().endswith('.png'):
-        mimetype = 'image/png'
-    elif filename.lower().endswith('.mp4'):
-        mimetype = 'video/mp4'
-    else:
-        mimetype = 'application/octet-stream'
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if USE_XACCEL:
+        # nginx streams the file with sendfile(); Flask only sends headers
+        resp = Response(mimetype=mimetype)
+        resp.headers["X-Accel-Redirect"] = f"{XACCEL_PREFIX}{filename}"
+        return resp
 
     return send_from_directory(DETECTIONS_DIR, filename, mimetype=mimetype)
 
@@ -426,20 +867,21 @@ def get_alert_stats():
     try:
         sb = get_supabase()
 
-        # Get counts
-        total_result = sb.table("alert_logs").select("id", count="exact").eq("user_id", user_id).execute()
-        unknown_result = sb.table("alert_logs").select("id", count="exact").eq("user_id", user_id).eq("is_known", False).execute()
-        high_threat_result = sb.table("alert_logs").select("id", count="exact").eq("user_id", user_id).eq("threat_level", "HIGH").execute()
+        # All three counts in one round-trip (see alert_stats migration)
+        result = sb.rpc("alert_stats", {"uid": user_id}).execute()
+        row = result.data[0] if result.data else {}
 
         return jsonify({
-            "total_alerts": total_result.count or 0,
-            "unknown_alerts": unknown_result.count or 0,
-            "high_threat_alerts": high_threat_result.count or 0
+            "total_alerts": row.get("total") or 0,
+            "unknown_alerts": row.get("unknown") or 0,
+            "high_threat_alerts": row.get("high") or 0
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 if __name__ == "__main__":
+    # Development server only; in production run under gunicorn:
+    #   gunicorn -c gunicorn.conf.py api:app
     port = int(os.getenv("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,48 @@
+"""
+Batched background writes
+Items queued close together are handed to one write(batch) call on a
+background thread, so request handlers and the camera loop never wait on
+the network round-trip
+"""
+
+import queue
+import threading
+import time
+
+
+class BatchWriter:
+    """Collects items for up to `window` seconds (or `batch_size` items) and writes them together"""
+
+    def __init__(self, write, batch_size, window):
+        self.write = write
+        self.batch_size = batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def put(self, item):
+        # Started lazily so the thread exists in each worker process, not just a pre-fork parent
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f"Batched write failed ({len(batch)} items): {e}")
@@ -1,9 +1,38 @@
-import google.generativeai as genai
+from google import genai
 import os
+import time
+from functools import lru_cache
 from datetime import datetime
 from dotenv import load_dotenv
 load_dotenv()
 
+ANGLE_BUCKET_DEGREES = 5
+
+PROMPT_TEMPLATE = """SECURITY ALERT - {ts}
+
+            SUBJECT: {identity}
+            STATUS: {status}
+            LOCATION: {angle:.1f}° from camera
+
+            Output format:
+            THREAT: [LOW/MEDIUM/HIGH]
+            STATUS: [AUTHORIZED/INTRUDER]
+            ACTION: [What to do in 15 words]
+
+            Keep recommendations practical for a vehicle personal security system (i.e. Review footage and proceed with caution)."""
+
+_timestamp_cache = [None, ""]
+
+
+def _cached_timestamp():
+    """Prompt timestamp, formatted at most once per second"""
+    second = int(time.time())
+    if _timestamp_cache[0] != second:
+        _timestamp_cache[0] = second
+        _timestamp_cache[1] = datetime.fromtimestamp(second).strftime('%I:%M:%S %p')
+    return _timestamp_cache[1]
+
+
 class GeminiThreatAnalyzer:
     def __init__(self):
         api_key = os.getenv('GEMINI_API_KEY')
@@ -14,8 +43,11 @@ class GeminiThreatAnalyzer:
             return
         
         try:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-3-flash-preview')
+            # One client for the process: its HTTP pool keeps the TLS connection alive
+            self.client = genai.Client(api_key=api_key)
+            self.model_name = 'gemini-3-flash-preview'
+            # Failed calls raise, so only real assessments are cached
+            self._assess_cached = lru_cache(maxsize=256)(self._generate_assessment)
             self.enabled = True
             print("Gemini AI initialized")
         except Exception as e:
@@ -29,28 +61,29 @@ class GeminiThreatAnalyzer:
         try:
             is_known = person.get('is_known', False)
             identity = person.get('identity', 'UNKNOWN')
-            confidence = person.get('confidence', 0)
             angle = person.get('tracking', {}).get('angle', 0)
+            # Bucket the angle so repeat alerts for the same person hit the cache
+            angle_bucket = round(angle / ANGLE_BUCKET_DEGREES) * ANGLE_BUCKET_DEGREES
             
-            prompt = f"""SECURITY ALERT - {datetime.now().strftime('%I:%M:%S %p')}
-
-            SUBJECT: {identity}
-            STATUS: {'AUTHORIZED' if is_known else 'INTRUDER'}
-            LOCATION: {angle:.1f}° from camera
-
-            Output format:
-            THREAT: [LOW/MEDIUM/HIGH]
-            STATUS: [AUTHORIZED/INTRUDER]
-            ACTION: [What to do in 15 words]
-
-            Keep recommendations practical for a vehicle personal security system (i.e. Review footage and proceed with caution)."""
-            
-            response = self.model.generate_content(prompt)
-            assessment = response.text.strip()
+            assessment = self._assess_cached(is_known, identity, angle_bucket)
             
             print(f"AI: {identity} -> {assessment[:500]}")
             return assessment
             
         except Exception as e:
             print(f"AI error: {e}")
-            return "Assessment failed"
\ No newline at end of file
+            return "Assessment failed"
+    
+    def _generate_assessment(self, is_known, identity, angle):
+        prompt = PROMPT_TEMPLATE.format_map({
+            'ts': _cached_timestamp(),
+            'identity': identity,
+            'status': 'AUTHORIZED' if is_known else 'INTRUDER',
+            'angle': angle,
+        })
+        
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=prompt
+        )
+        return response.text.strip()
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Gunicorn config for the Sentryx API
+Run from backend/: gunicorn -c gunicorn.conf.py api:app
+
+preload_app imports api.py (dlib models, InsightFace) once in the master;
+forked workers share those pages copy-on-write instead of each loading them.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+worker_tmp_dir = "/dev/shm"
+timeout = 60
+
+
+def post_fork(server, worker):
+    # ONNX Runtime thread pools don't survive fork; give each worker its own session
+    import api
+    api.load_face_detector()
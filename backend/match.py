@@ -0,0 +1,121 @@
+"""
+Face encoding matcher
+Finds the nearest familiar face for a probe encoding, and converts
+encodings to/from the familiar_faces.encoding_bin bytea column
+
+Uses a serial Numba JIT kernel (fused subtract/square/sum)
+when numba is installed, otherwise a vectorized NumPy scan.
+"""
+
+import os
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _nearest_numpy(mat, probe):
+    distances = np.sqrt(((mat - probe) ** 2).sum(axis=1))
+    best_idx = int(np.argmin(distances))
+    return best_idx, float(distances[best_idx])
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _nearest_jit(mat, probe):
+        # Serial: no Numba threading layer gets started in the gunicorn master (preload_app)
+        # before fork, and a few hundred 128-d rows gain nothing from threads anyway
+        n, dim = mat.shape
+        distances = np.empty(n, dtype=np.float32)
+        for i in range(n):
+            acc = 0.0
+            for j in range(dim):
+                diff = mat[i, j] - probe[j]
+                acc += diff * diff
+            distances[i] = acc
+
+        best_idx = 0
+        for i in range(1, n):
+            if distances[i] < distances[best_idx]:
+                best_idx = i
+        return best_idx, np.sqrt(distances[best_idx])
+
+    @njit(cache=True, fastmath=True)
+    def _squared_distances_jit(mat, probe, out):
+        # Serial on purpose: for small matrices thread/BLAS dispatch costs more than the math
+        n, dim = mat.shape
+        for i in range(n):
+            acc = np.float32(0.0)
+            for j in range(dim):
+                diff = mat[i, j] - probe[j]
+                acc += diff * diff
+            out[i] = acc
+
+HAVE_JIT = njit is not None
+
+
+# dlib landmark model used to align faces before encoding. Every producer of
+# encodings (enrollment, training capture, live matching) must use the same one.
+# 'small' (5-point) is face_recognition's own default, so stored encodings were
+# built with it; 'large' (68-point) would need existing faces re-enrolled
+LANDMARK_MODEL = os.getenv("FACE_LANDMARK_MODEL", "small")
+
+
+# familiar_faces.encoding_bin holds big-endian float32 (Postgres float4send order)
+ENCODING_DTYPE = np.dtype('>f4')
+
+
+def encoding_to_bytea(encoding):
+    """PostgREST bytea literal (hex) for a 128-d encoding"""
+    return "\\x" + np.asarray(encoding, dtype=ENCODING_DTYPE).tobytes().hex()
+
+
+def encoding_from_row(row):
+    """Encoding from a familiar_faces row, preferring encoding_bin over the legacy jsonb list"""
+    encoding_bin = row.get("encoding_bin")
+    if encoding_bin:
+        return np.frombuffer(bytes.fromhex(encoding_bin[2:]), dtype=ENCODING_DTYPE)
+    return np.asarray(row["encoding"], dtype=np.float32)
+
+
+def rows_to_matrix(rows):
+    """Decode familiar_faces rows into one preallocated (N, 128) float32 matrix"""
+    mat = np.empty((len(rows), 128), dtype=np.float32)
+    for i, row in enumerate(rows):
+        mat[i] = encoding_from_row(row)
+    return mat
+
+
+def nearest(mat, probe):
+    """
+    Index and L2 distance of the row in mat closest to probe
+    Returns (-1, inf) for an empty matrix
+    """
+    if mat is None or len(mat) == 0:
+        return -1, float("inf")
+
+    probe = np.ascontiguousarray(probe, dtype=np.float32)
+    if njit is not None:
+        best_idx, best_distance = _nearest_jit(mat, probe)
+        return int(best_idx), float(best_distance)
+    return _nearest_numpy(mat, probe)
+
+
+def squared_distances(mat, probe, out=None):
+    """Squared L2 distance from probe to every row of mat (float32), written into out"""
+    if out is None:
+        out = np.empty(len(mat), dtype=np.float32)
+    probe = np.ascontiguousarray(probe, dtype=np.float32)
+    if njit is not None:
+        _squared_distances_jit(mat, probe, out)
+    else:
+        np.einsum('ij,ij->i', mat - probe, mat - probe, out=out)
+    return out
+
+
+# Compile at import so the first request doesn't pay the JIT cost
+nearest(np.zeros((1, 128), dtype=np.float32), np.zeros(128, dtype=np.float32))
+squared_distances(np.zeros((1, 128), dtype=np.float32), np.zeros(128, dtype=np.float32))
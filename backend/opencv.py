@@ -17,32 +17,124 @@ import face_recognition
 import numpy as np
 from datetime import datetime, timedelta
 import os
+import sys
+import io
+import hashlib
 import pickle
 import json
 import time
+import queue
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Cap OpenCV's internal pool so it doesn't oversubscribe cores next to the capture/detect threads
+cv2.setNumThreads(min(4, os.cpu_count() or 1))
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
 from gemini import GeminiThreatAnalyzer
+import match
+from batching import BatchWriter
+from match import LANDMARK_MODEL, encoding_from_row
 
 _supabase_client = None
+_supabase_client_lock = threading.Lock()
+# Bounded so a stalled Supabase call can't pin an alert worker forever
+SUPABASE_TIMEOUT = 10  # seconds
 
 def _get_supabase():
+    """
+    One Supabase client for the whole process (detect thread, alert pool, batch writers):
+    its PostgREST and Storage HTTP clients keep their connections alive between calls
+    """
     global _supabase_client
     if _supabase_client is None:
-        try:
-            from supabase import create_client
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-            if url and key:
-                _supabase_client = create_client(url, key)
-        except Exception as e:
-            print(f"Supabase init failed: {e}")
+        with _supabase_client_lock:
+            if _supabase_client is None:
+                try:
+                    from supabase import ClientOptions, create_client
+                    url = os.getenv("SUPABASE_URL")
+                    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+                    if url and key:
+                        _supabase_client = create_client(url, key, options=ClientOptions(
+                            postgrest_client_timeout=SUPABASE_TIMEOUT,
+                            storage_client_timeout=SUPABASE_TIMEOUT,
+                        ))
+                except Exception as e:
+                    print(f"Supabase init failed: {e}")
     return _supabase_client
 
+_twilio_client = None
+_twilio_client_lock = threading.Lock()
+# SMS to all of an alert's contacts go out in parallel
+SMS_TIMEOUT = 15  # seconds to wait for a batch of sends
+_sms_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sms")
+SMS_TEXT_BYTES = 120
+SMS_VIEW_SUFFIX = "\n\nView: %s"
+# The same text to the same phone within this window is sent once
+SMS_DEDUPE_WINDOW = 60  # seconds
+_sms_sent = {}  # (phone, body digest) -> time.monotonic() of the send
+_sms_sent_lock = threading.Lock()
+
+
+def _claim_sms(phone, body):
+    """Reserve a send of body to phone; the claim key, or None if it already went out within the window"""
+    key = (phone, hashlib.blake2b(body.encode(), digest_size=8).digest())
+    now = time.monotonic()
+    with _sms_sent_lock:
+        if now - _sms_sent.get(key, -SMS_DEDUPE_WINDOW) < SMS_DEDUPE_WINDOW:
+            return None
+        # Drop expired entries so the dict stays small
+        for stale in [k for k, sent_at in _sms_sent.items() if now - sent_at >= SMS_DEDUPE_WINDOW]:
+            del _sms_sent[stale]
+        _sms_sent[key] = now
+    return key
+
+
+def _release_sms(key):
+    with _sms_sent_lock:
+        _sms_sent.pop(key, None)
+
+
+def _get_twilio_client():
+    """Shared Twilio client so SMS sends reuse one HTTP session; None if not configured"""
+    global _twilio_client
+    with _twilio_client_lock:
+        if _twilio_client is None:
+            try:
+                from twilio.rest import Client
+                account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+                auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+                if account_sid and auth_token:
+                    _twilio_client = Client(account_sid, auth_token)
+            except Exception as e:
+                print(f"Twilio init failed: {e}")
+    return _twilio_client
+
+
+# Below this many faces the float32 GEMV is already trivial; int8 only pays off at scale
+INT8_MIN_FACES = 4096
+# Below this many faces the compiled scan in match.squared_distances beats BLAS
+JIT_MAX_FACES = 512
+# Above this many faces identification goes through an HNSW index (needs hnswlib)
+ANN_MIN_FACES = 1024
+ANN_TOP_K = 5
+
+# Identifications reused for face crops with an unchanged perceptual hash
+ID_CACHE_SIZE = 128
+ID_CACHE_TTL = 2.0  # seconds before a still face is re-encoded anyway
+
+# Long-lived threads for alert uploads/DB writes (reuse the Supabase client's connections)
+ALERT_IO_WORKERS = 4
+
 
 class FastFaceDatabase:
     def __init__(self, database_path='face_database_fast.pkl', user_id=None):
@@ -51,32 +143,116 @@ class FastFaceDatabase:
         self.known_encodings = []
         self.known_names = []
         self.encoding_matrix = None
+        self.encoding_norms_sq = None
+        self.label_to_name = []
+        self.known_label_ids = None
+        self.encoding_matrix_i8 = None
+        self.row_scale = None
+        self.ann = None
+        self._dist_buf = None
         self.load_database()
 
+    # Local database: float32 (N, 128) matrix in .npy (memory-mapped on load),
+    # names in .json, optional HNSW index in .hnsw. database_path (.pkl) is
+    # only read as a legacy fallback.
+    @property
+    def matrix_path(self):
+        return os.path.splitext(self.database_path)[0] + '.npy'
+
+    @property
+    def names_path(self):
+        return os.path.splitext(self.database_path)[0] + '.json'
+
+    @property
+    def ann_path(self):
+        return os.path.splitext(self.database_path)[0] + '.hnsw'
+
+    def _build_ann(self, persisted_path=None):
+        """HNSW index over encoding_matrix, reusing a saved one when it matches"""
+        n = len(self.encoding_matrix)
+        ann = hnswlib.Index(space='l2', dim=128)
+        if persisted_path and os.path.exists(persisted_path):
+            try:
+                ann.load_index(persisted_path, max_elements=n)
+                if ann.get_current_count() == n:
+                    ann.set_ef(50)
+                    return ann
+            except Exception as e:
+                print(f"Saved HNSW index unusable, rebuilding: {e}")
+            ann = hnswlib.Index(space='l2', dim=128)
+        ann.init_index(max_elements=n, ef_construction=200, M=16)
+        ann.add_items(self.encoding_matrix, np.arange(n))
+        ann.set_ef(50)
+        return ann
+
+    def _build_index(self, persisted_ann_path=None):
+        """Float32 matrix, squared row norms and label ids for identification"""
+        if len(self.known_encodings):
+            self.encoding_matrix = np.ascontiguousarray(self.known_encodings, dtype=np.float32)
+            self.encoding_norms_sq = np.einsum('ij,ij->i', self.encoding_matrix, self.encoding_matrix)
+        else:
+            self.encoding_matrix = None
+            self.encoding_norms_sq = None
+
+        # Small databases: output buffer for the compiled distance scan
+        self._dist_buf = None
+        if match.HAVE_JIT and self.encoding_matrix is not None and len(self.encoding_matrix) < JIT_MAX_FACES:
+            self._dist_buf = np.empty(len(self.encoding_matrix), dtype=np.float32)
+
+        # Large databases: approximate nearest neighbours instead of a full scan
+        self.ann = None
+        if hnswlib is not None and self.encoding_matrix is not None and len(self.encoding_matrix) >= ANN_MIN_FACES:
+            self.ann = self._build_ann(persisted_ann_path)
+
+        # Otherwise an int8 copy with a per-row scale (4x less bandwidth than float32)
+        self.encoding_matrix_i8 = None
+        self.row_scale = None
+        if self.ann is None and self.encoding_matrix is not None and len(self.encoding_matrix) >= INT8_MIN_FACES:
+            max_abs = np.abs(self.encoding_matrix).max(axis=1)
+            max_abs[max_abs == 0] = 1.0
+            self.encoding_matrix_i8 = np.round(self.encoding_matrix * (127.0 / max_abs)[:, None]).astype(np.int8)
+            self.row_scale = (max_abs / 127.0).astype(np.float32)
+
+        # Integer label per row so voting is a single bincount
+        self.label_to_name = sorted(set(self.known_names))
+        name_to_id = {name: i for i, name in enumerate(self.label_to_name)}
+        self.known_label_ids = np.fromiter(
+            (name_to_id[name] for name in self.known_names),
+            dtype=np.int32, count=len(self.known_names)
+        )
+
     def load_database(self):
         sb = _get_supabase()
         if sb and self.user_id:
             try:
-                r = sb.table("familiar_faces").select("name, encoding").eq("user_id", self.user_id).execute()
+                r = sb.table("familiar_faces").select("name, encoding, encoding_bin").eq("user_id", self.user_id).execute()
                 if r.data and len(r.data) > 0:
+                    # Replace (not extend) so periodic reloads don't duplicate faces
+                    self.known_encodings = []
+                    self.known_names = []
                     for row in r.data:
-                        enc = np.array(row["encoding"], dtype=np.float64)
+                        enc = encoding_from_row(row).astype(np.float32)
                         self.known_encodings.append(enc)
                         self.known_names.append(row["name"])
-                    if self.known_encodings:
-                        self.encoding_matrix = np.array(self.known_encodings)
+                    self._build_index()
                     print(f"Loaded {len(self.known_names)} faces from Supabase")
                     return
             except Exception as e:
                 print(f"Supabase load failed: {e}")
 
-        if os.path.exists(self.database_path):
+        if os.path.exists(self.matrix_path) and os.path.exists(self.names_path):
+            # Maps the file instead of unpickling N arrays; _build_index keeps it as is
+            self.known_encodings = np.load(self.matrix_path, mmap_mode='r')
+            with open(self.names_path) as f:
+                self.known_names = json.load(f)['names']
+            self._build_index(persisted_ann_path=self.ann_path)
+            print(f"Loaded {len(self.known_names)} faces from local")
+        elif os.path.exists(self.database_path):
             with open(self.database_path, 'rb') as f:
                 data = pickle.load(f)
                 self.known_encodings = data['encodings']
                 self.known_names = data['names']
-                if self.known_encodings:
-                    self.encoding_matrix = np.array(self.known_encodings)
+                self._build_index(persisted_ann_path=self.ann_path)
                 print(f"Loaded {len(self.known_names)} faces from local")
         else:
             print("No face database found")
@@ -91,6 +267,16 @@ class FastFaceDatabase:
         self.known_encodings = []
         self.known_names = []
         
+        # Encodings of unchanged images are reused: {(sha1, model, num_jitters): [encodings]}
+        cache_path = os.path.join(folder_path, '.encoding_cache.pkl')
+        encoding_cache = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    encoding_cache = pickle.load(f)
+            except Exception as e:
+                print(f" Ignoring unreadable encoding cache: {e}")
+        
         print("\n" + "="*60)
         print(" Building facial recognition database")
         print("="*60)
@@ -108,7 +294,19 @@ class FastFaceDatabase:
                     image_path = os.path.join(person_dir, image_file)
                     
                     try:
-                        image = face_recognition.load_image_file(image_path)
+                        with open(image_path, 'rb') as f:
+                            raw = f.read()
+                        cache_key = (hashlib.sha1(raw).hexdigest(), LANDMARK_MODEL, 1)
+                        
+                        if cache_key in encoding_cache:
+                            encodings = [np.asarray(enc) for enc in encoding_cache[cache_key]]
+                            for enc in encodings:
+                                self.known_encodings.append(enc)
+                                self.known_names.append(person_name)
+                            print(f" {image_file} (cached)" if encodings else f" {image_file} - no face (cached)")
+                            continue
+                        
+                        image = face_recognition.load_image_file(io.BytesIO(raw))
                         
                         # Resize for speed
                         height, width = image.shape[:2]
@@ -122,15 +320,17 @@ class FastFaceDatabase:
                         if locations:
                             # num_jitters=1 for speed, we'll compensate with more photos
                             encodings = face_recognition.face_encodings(
-                                image, locations, num_jitters=1
+                                image, locations, num_jitters=1, model=LANDMARK_MODEL
                             )
                             
                             for enc in encodings:
                                 self.known_encodings.append(enc)
                                 self.known_names.append(person_name)
                             
+                            encoding_cache[cache_key] = [enc.tolist() for enc in encodings]
                             print(f" {image_file}")
                         else:
+                            encoding_cache[cache_key] = []
                             print(f" {image_file} - no face")
                             
                     except Exception as e:
@@ -139,8 +339,13 @@ class FastFaceDatabase:
             print(f"   Total: {self.known_names.count(person_name)} encodings")
         
         # Optimize for fast comparison
-        if self.known_encodings:
-            self.encoding_matrix = np.array(self.known_encodings)
+        self._build_index()
+        
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump(encoding_cache, f)
+        except Exception as e:
+            print(f" Could not save encoding cache: {e}")
         
         print("\n" + "="*60)
         print(f"Built {len(self.known_encodings)} encodings")
@@ -150,12 +355,21 @@ class FastFaceDatabase:
     
     def save_database(self):
         """Save database"""
-        with open(self.database_path, 'wb') as f:
-            pickle.dump({
-                'encodings': self.known_encodings,
-                'names': self.known_names
-            }, f)
-        print(f" Saved to {self.database_path}")
+        matrix = self.encoding_matrix
+        if matrix is None:
+            matrix = np.empty((0, 128), dtype=np.float32)
+        # Write then rename: a running loader may have the old .npy mapped
+        tmp_path = self.matrix_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, self.matrix_path)
+        with open(self.names_path, 'w') as f:
+            json.dump({'names': self.known_names}, f)
+        if self.ann is not None:
+            self.ann.save_index(self.ann_path)
+        elif os.path.exists(self.ann_path):
+            os.remove(self.ann_path)  # stale index for an older database
+        print(f" Saved to {self.matrix_path}")
     
     def identify_face_fast(self, face_encoding):
         """
@@ -165,29 +379,50 @@ class FastFaceDatabase:
         if self.encoding_matrix is None or len(self.encoding_matrix) == 0:
             return None, 0
         
-        # Vectorized distance calculation (MUCH faster)
-        distances = np.linalg.norm(self.encoding_matrix - face_encoding, axis=1)
-        
-        # Find best match
-        best_idx = np.argmin(distances)
-        best_distance = distances[best_idx]
-        
         # More lenient tolerance for speed/reliability balance
         tolerance = 0.50
         
-        if best_distance < tolerance:
+        if self.ann is not None:
+            # hnswlib 'l2' distances are squared, nearest first
+            labels, dist_sq = self.ann.knn_query(np.asarray(face_encoding, dtype=np.float32), k=ANN_TOP_K)
+            labels, dist_sq = labels[0], dist_sq[0]
+            matches = dist_sq < tolerance ** 2
+            if not matches[0]:
+                return None, 0
+            votes = np.bincount(self.known_label_ids[labels[matches]], minlength=len(self.label_to_name))
+            best_name = self.label_to_name[int(votes.argmax())]
+            return best_name, 1.0 - float(np.sqrt(max(dist_sq[0], 0.0)))
+        
+        # Squared distances via ||e||^2 + ||q||^2 - 2 e.q: one GEMV, no (N, 128) temporary
+        q = np.asarray(face_encoding, dtype=np.float32)
+        if self._dist_buf is not None:
+            # Small database: one compiled pass, no BLAS dispatch
+            dist_sq = match.squared_distances(self.encoding_matrix, q, self._dist_buf)
+        else:
+            if self.encoding_matrix_i8 is not None:
+                # Quantize the probe too; int8 products accumulate in int32
+                q_scale = max(float(np.abs(q).max()), 1e-12) / 127.0
+                q_i8 = np.round(q / q_scale).astype(np.int8)
+                dots_i32 = np.einsum('ij,j->i', self.encoding_matrix_i8, q_i8, dtype=np.int32)
+                dots = self.row_scale * q_scale * dots_i32
+            else:
+                dots = self.encoding_matrix @ q
+            dist_sq = self.encoding_norms_sq + float(q @ q) - 2.0 * dots
+        
+        # Find best match
+        best_idx = np.argmin(dist_sq)
+        
+        if dist_sq[best_idx] < tolerance ** 2:
+            best_distance = float(np.sqrt(max(dist_sq[best_idx], 0.0)))
+            
             # Get all matches within tolerance
-            matches = distances < tolerance
-            matching_indices = np.where(matches)[0]
+            matches = dist_sq < tolerance ** 2
             
-            # Voting (fast)
-            votes = {}
-            for idx in matching_indices:
-                name = self.known_names[idx]
-                votes[name] = votes.get(name, 0) + 1
+            # Voting (vectorized)
+            votes = np.bincount(self.known_label_ids[matches], minlength=len(self.label_to_name))
             
             # Best match
-            best_name = max(votes.items(), key=lambda x: x[1])[0]
+            best_name = self.label_to_name[int(votes.argmax())]
             confidence = 1.0 - best_distance
             
             return best_name, confidence
@@ -195,13 +430,46 @@ class FastFaceDatabase:
         return None, 0
 
 
-def send_camera_alert(device_id, motion=True, alert_type=None):
+# Finished recordings report their video_url through one background update
+# (set_alert_video_urls): uploads that complete close together share a single request.
+VIDEO_URL_BATCH_SIZE = 50
+VIDEO_URL_BATCH_WINDOW = 0.5  # seconds
+
+
+def _update_video_urls(batch):
+    sb = _get_supabase()
+    if not sb:
+        return
+    try:
+        sb.rpc("set_alert_video_urls", {"rows": batch}).execute()
+        print(f"  Updated {len(batch)} alert(s) with video URL")
+    except Exception as e:
+        print(f"  Warning: Failed to update alerts with video URL: {e}")
+
+
+_video_url_updates = BatchWriter(_update_video_urls, VIDEO_URL_BATCH_SIZE, VIDEO_URL_BATCH_WINDOW)
+
+
+def queue_video_url_update(row):
+    """Queue an {id, video_url} alert_logs update for the batched writer"""
+    _video_url_updates.put(row)
+
+
+def send_camera_alert(device_id, motion=True, alert_type=None, alert_types=None):
+    """
+    Post a camera event to ingest-camera
+    alert_types: every face alert raised in one frame, sent as a single request
+    """
     url = os.getenv("INGEST_CAMERA_URL")
     secret = os.getenv("DEVICE_SECRET")
     if not url or not secret:
         return
     try:
         payload = {"device_id": device_id, "motion": motion, "ultra_close": False}
+        if alert_types:
+            payload["alert_types"] = list(alert_types)
+            # Older ingest-camera deployments only read alert_type
+            alert_type = "unknown_face" if "unknown_face" in alert_types else alert_types[0]
         if alert_type:
             payload["alert_type"] = alert_type
         requests.post(
@@ -215,26 +483,36 @@ def send_camera_alert(device_id, motion=True, alert_type=None):
 
 
 class MotionDetector:
-    def __init__(self, sensitivity=500):
+    def __init__(self, sensitivity=500, scale=0.5, every_n=3):
+        # Runs on every Nth frame, downscaled; other frames reuse the last answer
+        self.scale = scale
+        self.every_n = max(1, every_n)
         self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
-            history=100, varThreshold=50, detectShadows=False
+            history=max(1, 100 // self.every_n), varThreshold=50, detectShadows=False
         )
         self.sensitivity = sensitivity
+        # Pixel areas shrink with the square of the downscale
+        self._area_scale = scale * scale
+        self._frame_no = 0
+        self._last_result = False
         self._last_alert = 0
         self._cooldown = 2
 
     def detect(self, frame):
+        self._frame_no += 1
+        if self._frame_no % self.every_n:
+            return self._last_result
+        
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
         fg_mask = self.bg_subtractor.apply(frame)
         _, thresh = cv2.threshold(fg_mask, 200, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-        motion_pixels = 0
-        for c in contours:
-            area = cv2.contourArea(c)
-            if area > 500:
-                motion_pixels += area
-        return motion_pixels > self.sensitivity
+        # Blob areas in one C call instead of a Python loop over contours
+        _, _, stats, _ = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+        areas = stats[1:, cv2.CC_STAT_AREA]  # row 0 is the background
+        motion_pixels = int(areas[areas > 500 * self._area_scale].sum())
+        self._last_result = motion_pixels > self.sensitivity * self._area_scale
+        return self._last_result
 
 
 class MediaPipeFaceDetector:
@@ -245,21 +523,50 @@ class MediaPipeFaceDetector:
         prototxt = "deploy.prototxt"
         model = "res10_300x300_ssd_iter_140000.caffemodel"
         
+        # Input buffers reused every frame instead of a fresh blobFromImage allocation
+        self._resize_buf = np.empty((300, 300, 3), dtype=np.uint8)
+        self._blob = np.zeros((1, 3, 300, 300), dtype=np.float32)
+        self._mean = np.array([104, 177, 123], dtype=np.float32).reshape(3, 1, 1)
+        
         # Try to load DNN model
         try:
             self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+            self._select_backend()
         except:
             print("âš ï¸  DNN model not found, falling back to face_recognition HOG")
             self.net = None
     
+    def _select_backend(self):
+        """Use the fastest DNN backend/target that actually runs: CUDA FP16, CPU FP16, CPU FP32"""
+        candidates = []
+        if hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0:
+            candidates.append(('CUDA FP16', cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA_FP16))
+        if hasattr(cv2.dnn, 'DNN_TARGET_CPU_FP16'):
+            candidates.append(('CPU FP16', cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU_FP16))
+        candidates.append(('CPU FP32', cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU))
+        
+        for label, backend, target in candidates:
+            try:
+                self.net.setPreferableBackend(backend)
+                self.net.setPreferableTarget(target)
+                # Probe with a blank blob; unsupported targets fail here, not mid-stream
+                self.net.setInput(self._blob)
+                self.net.forward()
+                print(f"DNN face detector running on {label}")
+                return
+            except cv2.error as e:
+                print(f"DNN {label} unavailable: {e}")
+    
     def detect_faces(self, frame):
         """Detect faces - fallback to HOG if DNN not available"""
         
         if self.net is not None:
             # Use DNN (fast)
             h, w = frame.shape[:2]
-            blob = cv2.dnn.blobFromImage(frame, 1.0, (300, 300), (104, 177, 123))
-            self.net.setInput(blob)
+            # Same as blobFromImage(frame, 1.0, (300, 300), (104, 177, 123)), written in place
+            cv2.resize(frame, (300, 300), dst=self._resize_buf)
+            np.subtract(self._resize_buf.transpose(2, 0, 1), self._mean, out=self._blob[0])
+            self.net.setInput(self._blob)
             detections = self.net.forward()
             
             faces = []
@@ -280,6 +587,24 @@ class MediaPipeFaceDetector:
                 faces.append([left, top, right, bottom])
             return faces
     
+    def detect_faces_batch(self, frames):
+        """Detect faces in several frames with a single DNN forward() call"""
+        if self.net is None:
+            return [self.detect_faces(frame) for frame in frames]
+        
+        blob = cv2.dnn.blobFromImages(frames, 1.0, (300, 300), (104, 177, 123))
+        self.net.setInput(blob)
+        # (1, 1, N, 7) rows of [batch index, class, confidence, x1, y1, x2, y2]
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] > 0.7]
+        
+        faces = []
+        for b, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            boxes = detections[detections[:, 0] == b, 3:7] * np.array([w, h, w, h])
+            faces.append(boxes.astype(int).tolist())
+        return faces
+    
     def __del__(self):
         pass  # No cleanup needed
 
@@ -288,24 +613,27 @@ class AlertCooldown:
     """Lightweight alert cooldown"""
     
     def __init__(self, cooldown_seconds=60):
-        self.cooldown_seconds = cooldown_seconds
-        self.last_alerts = {}
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.last_alerts = {}  # name -> time.monotonic() of the last alert
     
     def can_alert(self, person_name="unknown"):
-        current_time = datetime.now()
-        
         # Allow multiple alerts for unknowns
         if person_name == "UNKNOWN":
             return True
         
-        if person_name in self.last_alerts:
-            elapsed = (current_time - self.last_alerts[person_name]).total_seconds()
-            if elapsed < self.cooldown_seconds:
-                return False
+        now = time.monotonic()
+        if now - self.last_alerts.get(person_name, -self.cooldown_seconds) < self.cooldown_seconds:
+            return False
         
-        self.last_alerts[person_name] = current_time
+        self.last_alerts[person_name] = now
         return True
     
+    def would_alert(self, person_name="unknown"):
+        """can_alert without recording an alert"""
+        if person_name == "UNKNOWN":
+            return True
+        return time.monotonic() - self.last_alerts.get(person_name, -self.cooldown_seconds) >= self.cooldown_seconds
+    
     def reset_cooldown(self, person_name=None):
         if person_name:
             self.last_alerts.pop(person_name, None)
@@ -388,6 +716,18 @@ class FastSecuritySystem:
         self.use_mediapipe = config.get('use_mediapipe', True)
         self.use_yolo = config.get('use_yolo', False)
         self.detection_scale = config.get('detection_scale', 1.0)
+        # Between detector runs, follow the last faces with MOSSE trackers
+        # (opencv-contrib); the detector re-runs every N processed frames or
+        # as soon as a tracker loses its face. 0 disables tracking.
+        self.track_refresh_frames = config.get('track_refresh_frames', 15)
+        if self.track_refresh_frames and not hasattr(getattr(cv2, 'legacy', None), 'TrackerMOSSE_create'):
+            print("MOSSE tracker unavailable (needs opencv-contrib), detecting every processed frame")
+            self.track_refresh_frames = 0
+        self._face_trackers = []
+        self._tracked_frames = 0
+        # Per-frame working buffers, sized on the first frame
+        self._detect_scaled = None
+        self._rgb_full = None
         
         print("Loading face database...")
         user_id = config.get("user_id") or os.getenv("SUPABASE_USER_ID")
@@ -417,15 +757,28 @@ class FastSecuritySystem:
         os.makedirs(self.save_dir, exist_ok=True)
 
         self.device_id = config.get("device_id") or os.getenv("DEVICE_ID", "camera")
+        backend_url = os.getenv("EXPO_PUBLIC_BACKEND_URL", "http://localhost:5000").rstrip('/')
+        self._media_url_prefix = f"{backend_url}/api/alerts/media/"
         self.motion_detector = MotionDetector(sensitivity=config.get("motion_sensitivity", 500))
         self._motion_alert_cooldown = AlertCooldown(cooldown_seconds=30)
         self.last_detections = []
-        self._last_face_reload = time.time()
+        # dHash of a face crop -> ((identity, confidence), time identified)
+        self._id_cache = OrderedDict()
+        self._last_face_reload = time.monotonic()
         self._face_reload_interval = config.get("face_reload_interval", 300)
+        # Emergency contact phones, refreshed at most every contacts_cache_ttl seconds.
+        # Contacts are edited from the app straight in Supabase, so the TTL is the only
+        # invalidation: a new contact can miss alerts for up to this long
+        self._contacts_cache = (0.0, None)
+        self._contacts_cache_ttl = config.get("contacts_cache_ttl", 60)
+        self._contacts_lock = threading.Lock()
         
         print("Initializing AI threat analyzer...")
         self.gemini = GeminiThreatAnalyzer()
         
+        # Alert inserts, uploads and AI assessment run here, off the frame loop
+        self._alert_io = ThreadPoolExecutor(max_workers=ALERT_IO_WORKERS, thread_name_prefix="alert-io")
+        
         # Also add these video recording variables:
         self.recording = False
         self.recording_start = None
@@ -445,9 +798,59 @@ class FastSecuritySystem:
         
         print("Fast security system ready!")
     
-    def detect_and_recognize(self, frame):
+    def _frame_buffer(self, attr, shape):
+        """Reusable uint8 buffer, reallocated only when the stream size changes"""
+        buf = getattr(self, attr)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.uint8)
+            setattr(self, attr, buf)
+        return buf
+    
+    def _detection_input(self, frame, reuse_buffer=True):
+        """
+        Frame downscaled for detection, plus the factors to map boxes back
+        reuse_buffer=False returns a fresh array (for batches that hold several at once)
+        """
+        if self.detection_scale and self.detection_scale < 1.0:
+            height, width = frame.shape[:2]
+            scaled_w = max(1, int(width * self.detection_scale))
+            scaled_h = max(1, int(height * self.detection_scale))
+            dst = self._frame_buffer('_detect_scaled', (scaled_h, scaled_w, 3)) if reuse_buffer else None
+            scaled = cv2.resize(frame, (scaled_w, scaled_h), dst=dst, interpolation=cv2.INTER_AREA)
+            return scaled, width / scaled_w, height / scaled_h
+        return frame, 1.0, 1.0
+    
+    def detect_and_recognize_batch(self, frames):
+        """
+        detect_and_recognize for several queued frames, running the DNN
+        detector once for every frame that isn't skipped
+        """
+        if not (self.use_mediapipe and self.mediapipe_detector.net is not None) or self._tracking_due():
+            # Tracked frames skip the detector entirely, so there's nothing to batch
+            return [self.detect_and_recognize(frame) for frame in frames]
+        
+        # Same skip rule detect_and_recognize applies as frame_count advances
+        processed = [
+            i for i in range(len(frames))
+            if (self.frame_count + i + 1) % self.process_every_n_frames == 0
+        ]
+        # Each frame is downscaled once; detect_and_recognize reuses it and its scale factors
+        inputs = {i: self._detection_input(frames[i], reuse_buffer=False) for i in processed}
+        batch_bboxes = self.mediapipe_detector.detect_faces_batch(
+            [inputs[i][0] for i in processed]
+        ) if processed else []
+        bboxes_by_frame = dict(zip(processed, batch_bboxes))
+        
+        return [
+            self.detect_and_recognize(frame, face_bboxes=bboxes_by_frame.get(i), detection_input=inputs.get(i))
+            for i, frame in enumerate(frames)
+        ]
+    
+    def detect_and_recognize(self, frame, face_bboxes=None, detection_input=None):
         """
         OPTIMIZED detection pipeline
+        face_bboxes: detector output for this frame's detection input, if already computed
+        detection_input: (scaled frame, scale_x, scale_y) from _detection_input, if already computed
         """
         self.frame_count += 1
         
@@ -460,18 +863,18 @@ class FastSecuritySystem:
         detected_persons = []
         
         # Use MediaPipe for face detection (MUCH faster)
-        frame_for_detection = frame
-        scale_x = 1.0
-        scale_y = 1.0
-        if self.detection_scale and self.detection_scale < 1.0:
-            height, width = frame.shape[:2]
-            scaled_w = max(1, int(width * self.detection_scale))
-            scaled_h = max(1, int(height * self.detection_scale))
-            frame_for_detection = cv2.resize(frame, (scaled_w, scaled_h))
-            scale_x = width / scaled_w
-            scale_y = height / scaled_h
-
-        if self.use_mediapipe:
+        if detection_input is None:
+            detection_input = self._detection_input(frame)
+        frame_for_detection, scale_x, scale_y = detection_input
+        
+        if face_bboxes is None and self._tracking_due():
+            tracked_bboxes = self._update_trackers(frame_for_detection)
+            if tracked_bboxes is not None:
+                return self._tracked_persons(tracked_bboxes, scale_x, scale_y)
+
+        if face_bboxes is not None:
+            pass  # Already detected as part of a batch
+        elif self.use_mediapipe:
             face_bboxes = self.mediapipe_detector.detect_faces(frame_for_detection)
         elif self.use_yolo:
             # Fallback to YOLO
@@ -488,79 +891,170 @@ class FastSecuritySystem:
         else:
             face_bboxes = []
         
-        # Process each detected face
-        for bbox in face_bboxes:
-            x1, y1, x2, y2 = map(int, bbox)
-            if scale_x != 1.0 or scale_y != 1.0:
-                x1 = int(x1 * scale_x)
-                x2 = int(x2 * scale_x)
-                y1 = int(y1 * scale_y)
-                y2 = int(y2 * scale_y)
-            
-            # Extract face region (expand slightly for better encoding)
-            height = y2 - y1
-            width = x2 - x1
-            
-            # Expand bbox by 20%
-            expand = 0.2
-            x1_exp = max(0, int(x1 - width * expand))
-            y1_exp = max(0, int(y1 - height * expand))
-            x2_exp = min(frame.shape[1], int(x2 + width * expand))
-            y2_exp = min(frame.shape[0], int(y2 + height * expand))
-            
-            face_region = frame[y1_exp:y2_exp, x1_exp:x2_exp]
-            
-            # Skip if too small
-            if face_region.shape[0] < 40 or face_region.shape[1] < 40:
-                continue
-            
-            identity = None
-            confidence = 0
-            
+        frame_h, frame_w = frame.shape[:2]
+        
+        # Scale boxes back to the full frame and drop tiny ones, all faces at once
+        bboxes = np.array(face_bboxes, dtype=np.int32).reshape(-1, 4)
+        if scale_x != 1.0 or scale_y != 1.0:
+            bboxes = (bboxes * np.array([scale_x, scale_y, scale_x, scale_y])).astype(np.int32)
+        
+        # Face boxes clipped to the frame
+        clipped = np.clip(bboxes, 0, [frame_w, frame_h, frame_w, frame_h])
+        keep = ((clipped[:, 3] - clipped[:, 1]) >= 32) & ((clipped[:, 2] - clipped[:, 0]) >= 32)
+        
+        boxes = bboxes[keep].tolist()
+        locations = [(top, right, bottom, left) for left, top, right, bottom in clipped[keep].tolist()]
+        
+        # Faces whose crop hasn't visibly changed reuse their last identification
+        hashes = [self._face_hash(frame, *location) for location in locations]
+        results = [self._cached_identity(h) for h in hashes]
+        misses = [i for i, result in enumerate(results) if result is None]
+        
+        # Encode every remaining face in the frame with one face_encodings call
+        encodings = [None] * len(misses)
+        if misses:
+            miss_locations = [locations[i] for i in misses]
             try:
-                # Convert to RGB
-                face_rgb = cv2.cvtColor(face_region, cv2.COLOR_BGR2RGB)
-                
-                # Get face encoding (HOG for speed)
-                locations = face_recognition.face_locations(face_rgb, model='hog')
-                
-                if locations:
-                    # num_jitters=1 for speed
+                # One RGB conversion per frame; faces are encoded from it, not from per-face copies
+                rgb_full = cv2.cvtColor(
+                    frame, cv2.COLOR_BGR2RGB,
+                    dst=self._frame_buffer('_rgb_full', frame.shape)
+                )
+                if self.use_mediapipe:
+                    # Detector boxes are already faces: encode from them directly
+                    # instead of running HOG again on a crop
                     encodings = face_recognition.face_encodings(
-                        face_rgb, locations, num_jitters=1
+                        rgb_full, miss_locations, num_jitters=1, model=LANDMARK_MODEL
                     )
-                    
-                    if encodings:
-                        # Fast vectorized identification
-                        identity, confidence = self.face_db.identify_face_fast(encodings[0])
-                
+                else:
+                    # YOLO boxes are whole people; find the face inside each
+                    for j, location in enumerate(miss_locations):
+                        person_encodings = self._encode_person_region(rgb_full, *location)
+                        if person_encodings:
+                            encodings[j] = person_encodings[0]
             except Exception as e:
                 pass  # Silent fail for speed
+        
+        for i, encoding in zip(misses, encodings):
+            identity = None
+            confidence = 0
             
-            # Update tracking
-            tracking_data = self.tracker.update_target([x1, y1, x2, y2])
-            
-            person_data = {
-                'bbox': [x1, y1, x2, y2],
-                'identity': identity if identity else 'UNKNOWN',
-                'confidence': confidence,
-                'is_known': identity is not None,
-                'tracking': tracking_data
-            }
-            
-            detected_persons.append(person_data)
+            if encoding is not None:
+                # Fast vectorized identification
+                identity, confidence = self.face_db.identify_face_fast(encoding)
+                self._cache_identity(hashes[i], identity, confidence)
             
-            self.stats['total_detections'] += 1
-            if identity:
-                self.stats['known_persons'] += 1
-            else:
-                self.stats['unknown_persons'] += 1
+            results[i] = (identity, confidence)
+        
+        for bbox, (identity, confidence) in zip(boxes, results):
+            detected_persons.append(self._person_data(bbox, identity, confidence))
+        
+        if self.track_refresh_frames:
+            self._seed_trackers(frame_for_detection, boxes, scale_x, scale_y)
         
         # Cache for skipped frames
         self.last_detections = detected_persons
         
         return detected_persons
     
+    def _person_data(self, bbox, identity, confidence):
+        """Person dict for one face, updating the coordinate tracker and stats"""
+        # Update tracking
+        tracking_data = self.tracker.update_target(bbox)
+        
+        self.stats['total_detections'] += 1
+        if identity:
+            self.stats['known_persons'] += 1
+        else:
+            self.stats['unknown_persons'] += 1
+        
+        return {
+            'bbox': bbox,
+            'identity': identity if identity else 'UNKNOWN',
+            'confidence': confidence,
+            'is_known': identity is not None,
+            'tracking': tracking_data
+        }
+    
+    def _tracking_due(self):
+        """True if the next processed frame should be tracked instead of detected"""
+        return bool(self._face_trackers) and self._tracked_frames < self.track_refresh_frames
+    
+    def _seed_trackers(self, frame_for_detection, boxes, scale_x, scale_y):
+        """Start one MOSSE tracker per face found by the detector"""
+        self._face_trackers = []
+        self._tracked_frames = 0
+        if not boxes:
+            return
+        gray = cv2.cvtColor(frame_for_detection, cv2.COLOR_BGR2GRAY)
+        for x1, y1, x2, y2 in boxes:
+            # Trackers run on the detection-scale frame
+            roi = (int(x1 / scale_x), int(y1 / scale_y),
+                   max(1, int((x2 - x1) / scale_x)), max(1, int((y2 - y1) / scale_y)))
+            tracker = cv2.legacy.TrackerMOSSE_create()
+            tracker.init(gray, roi)
+            self._face_trackers.append(tracker)
+    
+    def _update_trackers(self, frame_for_detection):
+        """Tracked (x, y, w, h) boxes, or None if any face was lost"""
+        gray = cv2.cvtColor(frame_for_detection, cv2.COLOR_BGR2GRAY)
+        tracked = []
+        for tracker in self._face_trackers:
+            ok, roi = tracker.update(gray)
+            if not ok:
+                self._face_trackers = []
+                return None
+            tracked.append(roi)
+        self._tracked_frames += 1
+        return tracked
+    
+    def _tracked_persons(self, tracked_bboxes, scale_x, scale_y):
+        """Move the last detections to their tracked boxes, keeping identities"""
+        detected_persons = []
+        for (x, y, w, h), previous in zip(tracked_bboxes, self.last_detections):
+            bbox = [int(x * scale_x), int(y * scale_y), int((x + w) * scale_x), int((y + h) * scale_y)]
+            identity = previous['identity'] if previous['is_known'] else None
+            detected_persons.append(self._person_data(bbox, identity, previous['confidence']))
+        
+        self.last_detections = detected_persons
+        return detected_persons
+    
+    @staticmethod
+    def _face_hash(frame, top, right, bottom, left):
+        """64-bit dHash of the grayscale face crop"""
+        gray = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+    
+    def _cached_identity(self, face_hash):
+        """(identity, confidence) for a recently identified crop, or None"""
+        entry = self._id_cache.get(face_hash)
+        if entry is None:
+            return None
+        result, identified_at = entry
+        if time.monotonic() - identified_at > ID_CACHE_TTL:
+            del self._id_cache[face_hash]
+            return None
+        self._id_cache.move_to_end(face_hash)
+        return result
+    
+    def _cache_identity(self, face_hash, identity, confidence):
+        self._id_cache[face_hash] = ((identity, confidence), time.monotonic())
+        self._id_cache.move_to_end(face_hash)
+        if len(self._id_cache) > ID_CACHE_SIZE:
+            self._id_cache.popitem(last=False)
+    
+    def _encode_person_region(self, rgb_frame, top, right, bottom, left):
+        """HOG-detect and encode the face inside a person box"""
+        # dlib needs a contiguous image; this is a plain copy, no colour conversion
+        face_rgb = np.ascontiguousarray(rgb_frame[top:bottom, left:right])
+        locations = face_recognition.face_locations(face_rgb, model='hog')
+        if not locations:
+            return []
+        return face_recognition.face_encodings(
+            face_rgb, locations, num_jitters=1, model=LANDMARK_MODEL
+        )
+    
     def draw_detections(self, frame, persons):
         """Fast drawing with minimal overhead"""
         for person in persons:
@@ -609,8 +1103,11 @@ class FastSecuritySystem:
                 image_path = f"{self.save_dir}/{thumbnail_filename}"
                 video_path = f"{self.save_dir}/{video_filename}"
 
-                # Save clean snapshot image with high quality
-                cv2.imwrite(image_path, frame_clean, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                # Save clean snapshot image with high quality; the same bytes get uploaded
+                _, jpeg = cv2.imencode('.jpg', frame_clean, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                image_data = jpeg.tobytes()
+                with open(image_path, 'wb') as f:
+                    f.write(image_data)
 
                 # Start video recording - favor quality for playback
                 height, width = frame_clean.shape[:2]
@@ -637,7 +1134,7 @@ class FastSecuritySystem:
                     pass
 
                 self.recording = True
-                self.recording_start = time.time()
+                self.recording_start = time.monotonic()
                 self.recording_size = (width, height)
                 self.current_video_path = video_path
                 self.current_image_path = image_path
@@ -650,25 +1147,27 @@ class FastSecuritySystem:
                 print(f"  Image: {image_path}")
                 print(f"  Video: {video_path} ({self.recording_duration}s)")
 
-                # Create alert log entry in Supabase immediately (URLs will be added async)
-                alert_id = self._save_alert_to_db(person, thumbnail_filename, video_filename)
-                self.current_alert_id = alert_id
+                # Create alert log entry in Supabase right away (URLs will be added async).
+                # Later jobs wait on this future for the alert id, so the frame loop never blocks on HTTP
+                alert_future = self._alert_io.submit(
+                    self._save_alert_to_db, person, thumbnail_filename, video_filename
+                )
+                self.current_alert_id = alert_future
 
                 # Upload thumbnail and run AI assessment in background (non-blocking)
-                threading.Thread(
-                    target=self._process_alert_async,
-                    args=(person, alert_id, image_path, thumbnail_filename),
-                    daemon=True
-                ).start()
+                self._alert_io.submit(
+                    self._process_alert_async, person, alert_future, image_data, thumbnail_filename
+                )
 
                 return True
 
             return False
 
-    def _process_alert_async(self, person, alert_id, image_path, thumbnail_filename):
+    def _process_alert_async(self, person, alert_future, image_data, thumbnail_filename):
         """Process alert in background: upload thumbnail and run AI assessment"""
         # Upload thumbnail to Supabase Storage
-        thumbnail_url = self._upload_to_storage(image_path, thumbnail_filename, 'image/jpeg')
+        thumbnail_url = self._upload_to_storage(image_data, thumbnail_filename, 'image/jpeg')
+        alert_id = alert_future.result()
 
         # Update alert with thumbnail URL
         if thumbnail_url and alert_id:
@@ -686,6 +1185,9 @@ class FastSecuritySystem:
         ai_assessment = self.gemini.assess_threat(person)
         print(f"  AI Assessment: {ai_assessment}")
 
+        # Send SMS/push notification on its own worker; it doesn't need the DB update below
+        self._alert_io.submit(self._send_notification, person, ai_assessment, thumbnail_filename)
+
         # Parse threat level from assessment
         threat_level = None
         if ai_assessment:
@@ -709,19 +1211,16 @@ class FastSecuritySystem:
                 except Exception as e:
                     print(f"  Warning: Failed to update alert with assessment: {e}")
 
-        # Send SMS/push notification
-        self._send_notification(person, ai_assessment, thumbnail_filename)
-
-    def _upload_to_storage(self, file_path, filename, content_type):
-        """Upload file to Supabase Storage and return public URL"""
+    def _upload_to_storage(self, file_data, filename, content_type):
+        """
+        Upload to Supabase Storage and return public URL
+        file_data: bytes, or a binary file object (streamed instead of read into memory)
+        """
         sb = _get_supabase()
         if not sb:
             return None
 
         try:
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-
             # Upload to 'alerts' bucket
             result = sb.storage.from_('alerts').upload(
                 filename,
@@ -741,8 +1240,8 @@ class FastSecuritySystem:
                 sb.storage.create_bucket('alerts', options={"public": True})
                 print("  Created 'alerts' storage bucket")
                 # Retry upload
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
+                if hasattr(file_data, 'seek'):
+                    file_data.seek(0)
                 sb.storage.from_('alerts').upload(
                     filename,
                     file_data,
@@ -794,20 +1293,19 @@ class FastSecuritySystem:
         return None
 
 
-    def _upload_video_async(self, video_path, video_filename, alert_id):
+    def _upload_video_async(self, video_path, video_filename, alert_future):
         """Upload video to Supabase Storage and update the alert record"""
-        video_url = self._upload_to_storage(video_path, video_filename, 'video/mp4')
+        # Pass the open file so the clip is streamed in the multipart body, not held in memory
+        with open(video_path, 'rb') as f:
+            video_url = self._upload_to_storage(f, video_filename, 'video/mp4')
+        alert_id = alert_future.result()
 
+        # No alert_id means the insert failed; there is no row to update
         if video_url and alert_id:
-            sb = _get_supabase()
-            if sb:
-                try:
-                    sb.table("alert_logs").update({
-                        "video_url": video_url
-                    }).eq("id", alert_id).execute()
-                    print(f"  Updated alert {alert_id} with video URL")
-                except Exception as e:
-                    print(f"  Warning: Failed to update alert with video URL: {e}")
+            queue_video_url_update({
+                "id": alert_id,
+                "video_url": video_url,
+            })
     
     def _send_notification(self, person, gemini_assessment, thumbnail_filename):
         """Send SMS and push notification with gemini assessment"""
@@ -824,8 +1322,7 @@ class FastSecuritySystem:
                 message = f"ALERT: Unknown person detected near your vehicle"
 
         # Build thumbnail URL for notifications
-        backend_url = os.getenv("EXPO_PUBLIC_BACKEND_URL", "http://localhost:5000")
-        thumbnail_url = f"{backend_url}/api/alerts/media/{thumbnail_filename}" if thumbnail_filename else None
+        thumbnail_url = self._media_url_prefix + thumbnail_filename if thumbnail_filename else None
 
         # Send to notification service (SMS via Twilio + push via Supabase Edge Function)
         self._trigger_notification_service(message, thumbnail_url, person)
@@ -842,48 +1339,64 @@ class FastSecuritySystem:
 
         try:
             # Get emergency contacts for the user
-            contacts_result = sb.table("emergency_contacts").select("phone").eq("user_id", user_id).execute()
+            phones = self._get_emergency_phones(sb, user_id)
 
-            if not contacts_result.data or len(contacts_result.data) == 0:
+            if not phones:
                 print("  No emergency contacts configured, skipping SMS")
                 return
 
             # Send SMS to each contact via Twilio
-            from twilio.rest import Client
-            account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-            auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+            client = _get_twilio_client()
             from_number = os.getenv("TWILIO_FROM_NUMBER")
 
-            if not all([account_sid, auth_token, from_number]):
+            if client is None or not from_number:
                 print("  Twilio credentials not configured, skipping SMS")
                 return
 
-            client = Client(account_sid, auth_token)
-
-            # Truncate message for SMS (160 char limit, leave room for URL)
-            sms_message = message[:120] if len(message) > 120 else message
-
-            for contact in contacts_result.data:
-                phone = contact.get("phone")
-                if phone:
+            # Truncate message for SMS (160 byte limit, leave room for URL),
+            # on a UTF-8 boundary so multi-byte characters can't push it over
+            sms_message = message.encode('utf-8')[:SMS_TEXT_BYTES].decode('utf-8', 'ignore')
+
+            # Include thumbnail URL in SMS if available; built once for every contact
+            full_message = sms_message + (SMS_VIEW_SUFFIX % thumbnail_url if thumbnail_url else "")
+
+            # Dedupe on the text alone: the thumbnail URL is unique per alert
+            futures = {}
+            for phone in phones:
+                sms_key = _claim_sms(phone, sms_message)
+                if sms_key is None:
+                    print(f"  Skipping duplicate SMS to {phone}")
+                    continue
+                future = _sms_pool.submit(client.messages.create, body=full_message, from_=from_number, to=phone)
+                futures[future] = (phone, sms_key)
+            try:
+                for future in as_completed(futures, timeout=SMS_TIMEOUT):
+                    phone, sms_key = futures[future]
                     try:
-                        # Include thumbnail URL in SMS if available
-                        full_message = sms_message
-                        if thumbnail_url:
-                            full_message += f"\n\nView: {thumbnail_url}"
-
-                        client.messages.create(
-                            body=full_message,
-                            from_=from_number,
-                            to=phone
-                        )
+                        future.result()
                         print(f"  SMS sent to {phone}")
                     except Exception as e:
+                        _release_sms(sms_key)  # let the next alert retry
                         print(f"  Failed to send SMS to {phone}: {e}")
+            except TimeoutError:
+                pending = [phone for future, (phone, _) in futures.items() if not future.done()]
+                print(f"  SMS still pending after {SMS_TIMEOUT}s: {', '.join(pending)}")
 
         except Exception as e:
             print(f"  Notification service error: {e}")
 
+    def _get_emergency_phones(self, sb, user_id):
+        """Emergency contact phone numbers, cached for contacts_cache_ttl seconds"""
+        with self._contacts_lock:
+            fetched_at, phones = self._contacts_cache
+            if phones is not None and time.monotonic() - fetched_at < self._contacts_cache_ttl:
+                return phones
+
+            result = sb.table("emergency_contacts").select("phone").eq("user_id", user_id).execute()
+            phones = [row["phone"] for row in (result.data or []) if row.get("phone")]
+            self._contacts_cache = (time.monotonic(), phones)
+            return phones
+
     def send_sms_alert(self, image_path, person):
         pass
 
@@ -891,6 +1404,61 @@ class FastSecuritySystem:
         pass
 
 
+# hostname -> (ip, expires_at), so stream reconnects skip DNS and `tailscale status`
+HOST_CACHE_TTL = 15 * 60  # seconds
+HOST_REFRESH_MARGIN = 60  # refresh in the background this long before expiry
+_host_cache = {}
+_host_cache_refreshing = set()
+_host_cache_lock = threading.Lock()
+
+
+def _cache_host_ip(hostname, ip):
+    with _host_cache_lock:
+        _host_cache[hostname] = (ip, time.monotonic() + HOST_CACHE_TTL)
+
+
+def _refresh_host_ip(hostname):
+    """Re-resolve hostname (DNS, then Tailscale peers) and update the cache"""
+    import socket
+    try:
+        ip = socket.gethostbyname(hostname)
+    except socket.gaierror:
+        ip = get_tailscale_ip()
+    if ip:
+        _cache_host_ip(hostname, ip)
+    with _host_cache_lock:
+        _host_cache_refreshing.discard(hostname)
+
+
+def cached_host_ip(hostname):
+    """Cached IP for hostname, or None; refreshed in the background shortly before expiry"""
+    with _host_cache_lock:
+        entry = _host_cache.get(hostname)
+        if entry is None:
+            return None
+        ip, expires_at = entry
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            return None
+        if remaining < HOST_REFRESH_MARGIN and hostname not in _host_cache_refreshing:
+            _host_cache_refreshing.add(hostname)
+            threading.Thread(target=_refresh_host_ip, args=(hostname,), daemon=True).start()
+    return ip
+
+
+def prefetch_stream_host(stream_url):
+    """Resolve the stream's host in the background so the cache is warm when the stream opens"""
+    from urllib.parse import urlparse
+    hostname = urlparse(str(stream_url)).hostname
+    if not hostname:
+        return  # local camera index
+    with _host_cache_lock:
+        if hostname in _host_cache_refreshing:
+            return
+        _host_cache_refreshing.add(hostname)
+    threading.Thread(target=_refresh_host_ip, args=(hostname,), daemon=True).start()
+
+
 def check_hostname_resolution(url):
     """Check if the hostname in a URL can be resolved"""
     import socket
@@ -900,7 +1468,7 @@ def check_hostname_resolution(url):
         parsed = urlparse(url)
         hostname = parsed.hostname
         if hostname:
-            socket.gethostbyname(hostname)
+            _cache_host_ip(hostname, socket.gethostbyname(hostname))
             return True, hostname
     except socket.gaierror as e:
         return False, str(e)
@@ -928,6 +1496,22 @@ def get_tailscale_ip():
     return None
 
 
+def _open_ffmpeg_capture(url):
+    """FFmpeg capture with hardware decode (V4L2 M2M, NVDEC, VAAPI...) when available"""
+    if hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        try:
+            cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+                cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY,
+                cv2.CAP_PROP_HW_DEVICE, -1,
+            ])
+            if cap.isOpened():
+                return cap
+        except cv2.error:
+            pass
+    # Older OpenCV, or no usable hardware decoder
+    return cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+
+
 def open_video_stream(stream_url):
     """
     Open video stream with proper configuration for remote HTTP streams
@@ -949,8 +1533,17 @@ def open_video_stream(stream_url):
     except (ValueError, TypeError):
         pass
 
+    # Plain HTTP streams connect straight to a recently resolved IP
+    # (HTTPS keeps the hostname for TLS)
+    from urllib.parse import urlparse
+    hostname = urlparse(str(stream_url)).hostname
+    cached_ip = cached_host_ip(hostname) if hostname else None
+    if cached_ip and str(stream_url).startswith('http://'):
+        stream_url = stream_url.replace(hostname, cached_ip, 1)
+        print(f"Using cached address: {stream_url}")
+
     # Check hostname resolution for HTTP/HTTPS URLs
-    if str(stream_url).startswith(('http://', 'https://')):
+    elif str(stream_url).startswith(('http://', 'https://')) and not cached_ip:
         can_resolve, info = check_hostname_resolution(stream_url)
         if not can_resolve:
             print(f"\n*** DNS RESOLUTION FAILED ***")
@@ -972,10 +1565,9 @@ def open_video_stream(stream_url):
                     rpi_ip = get_tailscale_ip()
                     if rpi_ip:
                         print(f"Found Raspberry Pi at: {rpi_ip}")
+                        _cache_host_ip(hostname, rpi_ip)
                         # Try with IP instead
-                        from urllib.parse import urlparse
-                        parsed = urlparse(stream_url)
-                        ip_url = stream_url.replace(parsed.hostname, rpi_ip)
+                        ip_url = stream_url.replace(hostname, rpi_ip)
                         print(f"Trying with IP: {ip_url}")
                         stream_url = ip_url
                     else:
@@ -994,7 +1586,7 @@ def open_video_stream(stream_url):
     # Try different backends for HTTP streams
     if str(stream_url).startswith(('http://', 'https://')):
         # Try FFMPEG backend first (better for HTTP streams)
-        cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
+        cap = _open_ffmpeg_capture(stream_url)
         if not cap.isOpened():
             # Fallback to default backend
             cap = cv2.VideoCapture(stream_url)
@@ -1013,7 +1605,7 @@ def open_video_stream(stream_url):
                     print(f"Connected using: {url}")
                     break
     elif str(stream_url).startswith('rtsp://'):
-        cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
+        cap = _open_ffmpeg_capture(stream_url)
     else:
         cap = cv2.VideoCapture(stream_url)
 
@@ -1033,6 +1625,149 @@ DEFAULT_STREAM_URL = os.getenv(
     "http://raspberrypi.tail56d975.ts.net:8889/cam/"
 )
 
+# No preview window (and no drawing) on servers/Pis; HEADLESS=0/1 overrides the display check
+HEADLESS = os.getenv(
+    "HEADLESS",
+    "1" if sys.platform.startswith("linux") and not (os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY")) else "0"
+) == "1"
+
+
+def _read_stdin_keys(keys_q):
+    """Headless stand-in for waitKey: q/s/r typed on stdin (then Enter)"""
+    for line in sys.stdin:
+        line = line.strip().lower()
+        if line:
+            keys_q.put(line[0])
+
+
+class TextStamp:
+    """putText output rasterized once into a mask and stamped until the text changes"""
+    
+    def __init__(self, org, font_scale, color, thickness):
+        self.org = org
+        self.font_scale = font_scale
+        self.color = color
+        self.thickness = thickness
+        self._text = None
+        self._mask = None
+        self._offset = (0, 0)
+    
+    def draw(self, frame, text):
+        if text != self._text:
+            (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, self.thickness)
+            pad = self.thickness
+            mask = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+            cv2.putText(mask, text, (pad, h + pad),
+                       cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, 255, self.thickness)
+            self._mask = mask.astype(bool)
+            self._offset = (self.org[0] - pad, self.org[1] - h - pad)
+            self._text = text
+        
+        x, y = self._offset
+        mh, mw = self._mask.shape
+        fh, fw = frame.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(fw, x + mw), min(fh, y + mh)
+        if x1 <= x0 or y1 <= y0:
+            return
+        frame[y0:y1, x0:x1][self._mask[y0 - y:y1 - y, x0 - x:x1 - x]] = self.color
+
+
+# FPS and counters change at most a few times a second; rasterize only when they do
+_stats_stamp = TextStamp((10, 30), 0.6, (0, 255, 255), 2)
+
+
+def _show_frame(frame, fps_display, system, persons):
+    """Draw the overlays, show the preview window and return the key pressed (or None)"""
+    # Stats overlay
+    stats_text = f"FPS: {fps_display} | Known: {system.stats['known_persons']} | Unknown: {system.stats['unknown_persons']}"
+    _stats_stamp.draw(frame, stats_text)
+    
+    # Stepper command
+    if persons:
+        cmd = system.tracker.get_stepper_command()
+        cmd_text = f"Stepper: {cmd['action']} @ {cmd['angle']:.1f}Â°"
+        cv2.putText(frame, cmd_text, (10, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+    
+    # Display
+    cv2.imshow('Fast Security System', frame)
+    
+    key = cv2.waitKey(1) & 0xFF
+    return chr(key) if key != 0xFF else None
+
+
+def _put_latest(q, item):
+    """Put without blocking; when the queue is full drop the oldest item so consumers see fresh frames"""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+# Most queued frames handed to one batched DNN forward()
+DNN_BATCH_MAX = 4
+
+
+def _capture_worker(cap, frames_q, stop_event):
+    """Pipeline stage 1: read frames as fast as the stream delivers them"""
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                _put_latest(frames_q, None)  # end of stream
+                return
+            _put_latest(frames_q, frame)
+    finally:
+        # Released by the only thread that reads it, so never under a concurrent read()
+        cap.release()
+
+
+def _detect_worker(system, frames_q, results_q, stop_event):
+    """Pipeline stage 2: face detection + encoding + identification"""
+    while not stop_event.is_set():
+        try:
+            frame = frames_q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if frame is None:
+            _put_latest(results_q, None)
+            return
+
+        # Take whatever else is already queued so the DNN runs once for all of it
+        frames = [frame]
+        end_of_stream = False
+        while len(frames) < DNN_BATCH_MAX:
+            try:
+                frame = frames_q.get_nowait()
+            except queue.Empty:
+                break
+            if frame is None:
+                end_of_stream = True
+                break
+            frames.append(frame)
+
+        try:
+            if time.monotonic() - system._last_face_reload > system._face_reload_interval:
+                system.face_db.load_database()
+                system._id_cache.clear()  # identities may have changed
+                system._last_face_reload = time.monotonic()
+
+            for frame, persons in zip(frames, system.detect_and_recognize_batch(frames)):
+                _put_latest(results_q, (frame, persons))
+        except Exception as e:
+            # Drop these frames rather than let the thread die under a still-running capture
+            print(f"Detection error: {e}")
+
+        if end_of_stream:
+            _put_latest(results_q, None)
+            return
+
 
 def main():
     """
@@ -1041,6 +1776,8 @@ def main():
 
     # Get stream URL from environment or use default
     stream_url = os.getenv("VIDEO_STREAM_URL", DEFAULT_STREAM_URL)
+    # DNS/Tailscale lookup overlaps with model loading below
+    prefetch_stream_host(stream_url)
 
     config = {
         'yolo_model': 'yolov8n.pt',
@@ -1105,37 +1842,75 @@ def main():
     print("Press 'q' to quit | 's' to save | 'r' to reset")
     print("="*60 + "\n")
     
-    fps_start = time.time()
+    fps_start = time.monotonic()
     fps_counter = 0
     fps_display = 0
     
+    # Three-stage pipeline: capture thread -> detect thread -> this loop
+    # (draw, record, alert, display), so capture and detection overlap
+    stop_event = threading.Event()
+    keys_q = queue.Queue()
+    if HEADLESS:
+        print("Headless: no preview window; type q/s/r + Enter for commands")
+        threading.Thread(target=_read_stdin_keys, args=(keys_q,), daemon=True).start()
+    # Two reused buffers for the clean (unannotated) copy of each displayed frame
+    clean_bufs = [None, None]
+    clean_idx = 0
+
+    # Latest-frame queues: producers drop the oldest item instead of blocking, so
+    # detection never works on a stale backlog. frames_q holds up to a full DNN batch;
+    # results_q holds a whole batch so pushing one doesn't evict its own earlier frames
+    # before the display/recording loop sees them
+    frames_q = queue.Queue(maxsize=DNN_BATCH_MAX)
+    results_q = queue.Queue(maxsize=DNN_BATCH_MAX)
+    workers = [
+        threading.Thread(target=_capture_worker, args=(cap, frames_q, stop_event), daemon=True),
+        threading.Thread(target=_detect_worker, args=(system, frames_q, results_q, stop_event), daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+    
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            try:
+                item = results_q.get(timeout=1.0)
+            except queue.Empty:
+                capture_worker, detect_worker = workers
+                # Stop if either stage died (capture only once its queued frames are consumed)
+                if not detect_worker.is_alive() or (not capture_worker.is_alive() and frames_q.empty()):
+                    print("Pipeline worker stopped; exiting")
+                    break
+                continue
+            if item is None:
                 break
-
-            if time.time() - system._last_face_reload > system._face_reload_interval:
-                system.face_db.load_database()
-                system._last_face_reload = time.time()
-
-            persons = system.detect_and_recognize(frame)
+            frame, persons = item
+            now = time.monotonic()  # one clock read per iteration
             
-            # Save clean frame for alert snapshots
-            frame_clean = frame.copy()
+            # Save clean frame for alert snapshots, into a reused buffer instead of a new copy.
+            # Only needed while recording or when someone here is off cooldown
+            frame_clean = None
+            if HEADLESS:
+                frame_clean = frame  # nothing gets drawn on it
+            elif system.recording or any(system.cooldown.would_alert(p['identity']) for p in persons):
+                frame_clean = clean_bufs[clean_idx]
+                if frame_clean is None or frame_clean.shape != frame.shape:
+                    frame_clean = clean_bufs[clean_idx] = np.empty_like(frame)
+                np.copyto(frame_clean, frame)
+                clean_idx ^= 1
             
             # Draw detections
-            frame = system.draw_detections(frame, persons)
+            if not HEADLESS:
+                frame = system.draw_detections(frame, persons)
             
             # Handle video recording (clean frames for higher quality)
             if system.recording:
+                # The writer is opened at the alert frame's size, so frames go in as is;
+                # resizing only happens if the stream changes resolution mid-recording
                 frame_to_write = frame_clean
-                if system.recording_size:
-                    target_w, target_h = system.recording_size
-                    if frame.shape[1] != target_w or frame.shape[0] != target_h:
-                        frame_to_write = cv2.resize(frame_to_write, (target_w, target_h))
+                if frame_to_write.shape[1::-1] != system.recording_size:
+                    frame_to_write = cv2.resize(frame_to_write, system.recording_size)
                 system.video_writer.write(frame_to_write)
-                if time.time() - system.recording_start > system.recording_duration:
+                if now - system.recording_start > system.recording_duration:
                     system.video_writer.release()
                     system.recording = False
                     system.video_writer = None
@@ -1143,60 +1918,60 @@ def main():
 
                     # Upload video to Supabase Storage in background
                     if hasattr(system, 'current_video_path') and hasattr(system, 'current_alert_id'):
-                        threading.Thread(
-                            target=system._upload_video_async,
-                            args=(system.current_video_path, system.current_video_filename, system.current_alert_id),
-                            daemon=True
-                        ).start()
+                        system._alert_io.submit(
+                            system._upload_video_async,
+                            system.current_video_path, system.current_video_filename, system.current_alert_id
+                        )
             
             motion_detected = system.motion_detector.detect(frame)
-            if motion_detected and system._motion_alert_cooldown.can_alert("motion"):
-                send_camera_alert(system.device_id, motion=True, alert_type=None)
+            motion_alert = motion_detected and system._motion_alert_cooldown.can_alert("motion")
 
+            alert_types = []
             for person in persons:
                 # Trigger alert for ALL detected persons (known and unknown)
                 alert_type = "known_face" if person['is_known'] else "unknown_face"
-                if system.trigger_alert(person, frame_clean):
-                    send_camera_alert(
-                        system.device_id, motion=True, alert_type=alert_type
-                    )
+                # No clean copy: nobody was off cooldown when the frame arrived, try next frame
+                if frame_clean is not None and system.trigger_alert(person, frame_clean):
+                    alert_types.append(alert_type)
+
+            # One ingest request per frame for the motion alert and any face alerts,
+            # posted from the alert pool so the loop doesn't wait on it
+            if motion_alert or alert_types:
+                system._alert_io.submit(
+                    send_camera_alert, system.device_id, motion=True, alert_types=alert_types
+                )
             
             # FPS calculation
             fps_counter += 1
-            if time.time() - fps_start > 1.0:
+            if now - fps_start > 1.0:
                 fps_display = fps_counter
                 fps_counter = 0
-                fps_start = time.time()
+                fps_start = now
             
-            # Stats overlay
-            stats_text = f"FPS: {fps_display} | Known: {system.stats['known_persons']} | Unknown: {system.stats['unknown_persons']}"
-            cv2.putText(frame, stats_text, (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-            
-            # Stepper command
-            if persons:
-                cmd = system.tracker.get_stepper_command()
-                cmd_text = f"Stepper: {cmd['action']} @ {cmd['angle']:.1f}Â°"
-                cv2.putText(frame, cmd_text, (10, 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-            
-            # Display
-            cv2.imshow('Fast Security System', frame)
-            
-            key = cv2.waitKey(1) & 0xFF
+            if HEADLESS:
+                try:
+                    key = keys_q.get_nowait()
+                except queue.Empty:
+                    key = None
+            else:
+                key = _show_frame(frame, fps_display, system, persons)
             
-            if key == ord('q'):
+            if key == 'q':
                 break
-            elif key == ord('s'):
+            elif key == 's':
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 cv2.imwrite(f"{system.save_dir}/manual_{timestamp}.jpg", frame)
-            elif key == ord('r'):
+            elif key == 'r':
                 system.cooldown.reset_cooldown()
     
     except KeyboardInterrupt:
         print("\n  Interrupted")
     
     finally:
+        stop_event.set()
+        for worker in workers:
+            worker.join(timeout=2.0)
+        
         print("\n" + "="*60)
         print("SHUTDOWN")
         print("="*60)
@@ -1209,11 +1984,15 @@ def main():
         print(f"  Final FPS: {fps_display}")
         print("="*60)
         
-        cap.release()
+        # A capture thread stuck in a stalled read() releases cap itself when it returns
+        if not workers[0].is_alive():
+            cap.release()
         cv2.destroyAllWindows()
         # Release video writer if still recording
         if system.recording:
             system.video_writer.release()
+        # Let queued alert inserts/uploads finish, drop ones that haven't started
+        system._alert_io.shutdown(wait=True, cancel_futures=True)
 
 
 if __name__ == '__main__':
@@ -3,17 +3,48 @@ Webcam Training Photo Capture Tool
 Captures training photos from remote video stream and uploads to Supabase familiar_faces
 """
 
-import cv2
 import os
+
+# dlib's HOG runs single-threaded; keep OpenMP/BLAS pools (read at import) from competing
+# with it. Must run before cv2, which imports numpy
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+
+import cv2
 import sys
 import base64
+import queue
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from dotenv import load_dotenv
 import face_recognition
+import dlib
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Leave a core free for the HOG detector process and the frame reader thread
+cv2.setUseOptimized(True)
+cv2.setNumThreads(max(1, (os.cpu_count() or 2) - 1))
 
 load_dotenv()
 
+import match
+from match import LANDMARK_MODEL
+
+# face_recognition detector: dlib's CNN (MMOD) when dlib was built with CUDA, HOG on CPU
+DETECTION_MODEL = os.getenv(
+    "FACE_DETECTION_MODEL",
+    "cnn" if getattr(dlib, "DLIB_USE_CUDA", False) else "hog"
+)
+
 # Default stream URL - can be overridden via env or argument
 DEFAULT_STREAM_URL = os.getenv(
     "VIDEO_STREAM_URL",
@@ -21,18 +52,32 @@ DEFAULT_STREAM_URL = os.getenv(
 )
 
 _supabase_client = None
+SUPABASE_TIMEOUT = 5  # seconds
+
+
+def _warm_supabase(client):
+    """Empty select so the PostgREST connection (TCP + TLS) is open before the first insert"""
+    try:
+        client.table("familiar_faces").select("id").limit(0).execute()
+    except Exception:
+        pass
 
 
 def _get_supabase():
-    """Lazy-load Supabase client"""
+    """
+    Lazy-load Supabase client; its PostgREST HTTP client keeps the connection alive
+    between calls
+    """
     global _supabase_client
     if _supabase_client is None:
         try:
-            from supabase import create_client
+            from supabase import ClientOptions, create_client
             url = os.getenv("SUPABASE_URL")
             key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
             if url and key:
-                _supabase_client = create_client(url, key)
+                _supabase_client = create_client(url, key, options=ClientOptions(
+                    postgrest_client_timeout=SUPABASE_TIMEOUT,
+                ))
             else:
                 print("Warning: SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY not set")
         except Exception as e:
@@ -40,6 +85,18 @@ def _get_supabase():
     return _supabase_client
 
 
+# Skip FFmpeg's stream probing and input buffering so the first frame arrives quickly
+# and reads stay close to live. Read when a VideoCapture is constructed
+FFMPEG_LOW_LATENCY_OPTIONS = "fflags;nobuffer|flags;low_delay|probesize;32|analyzeduration;0"
+
+
+def _set_ffmpeg_options(stream_url):
+    options = FFMPEG_LOW_LATENCY_OPTIONS
+    if stream_url.startswith('rtsp://'):
+        options += "|rtsp_transport;udp"
+    os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = options
+
+
 def open_video_stream(stream_url):
     """
     Open video stream with proper configuration for remote HTTP streams
@@ -53,6 +110,7 @@ def open_video_stream(stream_url):
 
     # Try different backends for HTTP streams
     if stream_url.startswith(('http://', 'https://')):
+        _set_ffmpeg_options(stream_url)
         # Try FFMPEG backend first (better for HTTP streams)
         cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
         if not cap.isOpened():
@@ -73,6 +131,7 @@ def open_video_stream(stream_url):
                     print(f"Connected using: {url}")
                     break
     elif stream_url.startswith('rtsp://'):
+        _set_ffmpeg_options(stream_url)
         cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
     else:
         # Local camera (integer ID)
@@ -92,48 +151,349 @@ def open_video_stream(stream_url):
     return cap
 
 
-def encode_face_from_frame(frame):
+# Preview detection runs on a copy downscaled to this width (HOG cost scales with pixels)
+PREVIEW_DETECT_WIDTH = 480
+# Preview detection runs on every Nth frame; the box is redrawn on the frames between
+PREVIEW_DETECT_EVERY = 3
+
+# While the scene is static (mean abs diff of a 160x120 gray thumbnail below the
+# threshold) the last detection is reused, re-detecting at least every N frames
+STATIC_DIFF_THRESHOLD = 3.0
+STATIC_MAX_REUSE = 15
+# The scene also counts as static while the thumbnail's dHash stays within this many
+# bits of the last detected frame's (gradients ignore MJPEG brightness flicker)
+STATIC_HASH_DISTANCE = 5
+
+# When something moves, HOG searches only the moving area plus the padded last
+# face box; the whole frame every FULL_DETECT_EVERY detections or when that
+# region covers over half the frame
+FULL_DETECT_EVERY = 10
+MOTION_PIXEL_THRESHOLD = 25
+
+
+class LatestFrameGrabber:
     """
-    Detect and encode face from a frame
-    Returns (encoding, face_location) or (None, None) if no face found
+    Reads a VideoCapture on a background thread and keeps only the newest frame,
+    so slow processing never falls behind a backlog of buffered frames
+    """
+
+    def __init__(self, cap):
+        self.cap = cap
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._returned_seq = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                # Don't spin on a dropped stream; read() times out and the caller retries
+                time.sleep(0.05)
+                continue
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._cond.notify()
+        # Released here, by the only thread that reads it: never under a concurrent read()
+        self.cap.release()
+
+    def read(self, timeout=1.0):
+        """(True, frame) for a frame not returned before, or (False, None) on timeout"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._returned_seq, timeout):
+                return False, None
+            self._returned_seq = self._seq
+            return True, self._frame
+
+    def release(self):
+        """Stop reading; the reader releases the capture once its current read() returns"""
+        self._running = False
+        self._thread.join(timeout=2.0)
+
+
+def detect_face(frame, max_width=None):
+    """
+    Face locations in a BGR frame (DETECTION_MODEL, no encoding), in full-frame coordinates
+    max_width: detect on a downscaled copy, without upsampling, and scale the boxes back
     """
-    # Convert BGR to RGB for face_recognition
+    h, w = frame.shape[:2]
+    if max_width and w > max_width:
+        scale = w / max_width
+        small = cv2.resize(frame, (max_width, int(h / scale)), interpolation=cv2.INTER_AREA)
+        # small is our own copy, so convert it in place (dlib needs a contiguous RGB array)
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=small)
+        locations = face_recognition.face_locations(small, number_of_times_to_upsample=0, model=DETECTION_MODEL)
+        return [
+            (int(top * scale), int(right * scale), int(bottom * scale), int(left * scale))
+            for top, right, bottom, left in locations
+        ]
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return face_recognition.face_locations(rgb_frame, model=DETECTION_MODEL)
 
-    # Detect faces using HOG (fast)
-    face_locations = face_recognition.face_locations(rgb_frame, model='hog')
 
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _mean_abs_diff_jit(a, b):
+        # Serial: a 160x120 thumbnail is too small for threads to pay off
+        a = a.ravel()
+        b = b.ravel()
+        acc = 0
+        for i in range(a.size):
+            acc += abs(np.int32(a[i]) - np.int32(b[i]))
+        return acc / a.size
+
+
+def mean_abs_diff(a, b):
+    """Mean absolute difference of two same-shape uint8 images"""
+    if njit is not None:
+        return _mean_abs_diff_jit(a, b)
+    return cv2.absdiff(a, b).mean()
+
+
+def thumb_dhash(thumb):
+    """64-bit dHash of a gray thumbnail, as an int"""
+    small = cv2.resize(thumb, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), 'big')
+
+
+def motion_roi(thumb, prev_thumb, frame_shape, face_location, pad=0.5):
+    """
+    (x1, y1, x2, y2) in frame coordinates covering the pixels that changed between
+    two gray thumbnails plus the padded last face box, or None to search the whole frame
+    """
+    h, w = frame_shape[:2]
+    th, tw = thumb.shape[:2]
+    diff = cv2.absdiff(cv2.GaussianBlur(thumb, (5, 5), 0), cv2.GaussianBlur(prev_thumb, (5, 5), 0))
+    _, mask = cv2.threshold(diff, MOTION_PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return None
+    mx, my, mw, mh = cv2.boundingRect(points)
+    sx, sy = w / tw, h / th
+    x1, y1, x2, y2 = int(mx * sx), int(my * sy), int((mx + mw) * sx), int((my + mh) * sy)
+
+    if face_location:
+        top, right, bottom, left = face_location
+        pad_x, pad_y = int((right - left) * pad), int((bottom - top) * pad)
+        x1, y1 = min(x1, left - pad_x), min(y1, top - pad_y)
+        x2, y2 = max(x2, right + pad_x), max(y2, bottom + pad_y)
+
+    x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+    if (x2 - x1) * (y2 - y1) > 0.5 * w * h:
+        return None
+    return x1, y1, x2, y2
+
+
+def _preview_detect_worker(shm_name, shape, requests, results):
+    """Detector process: HOG on the shared frame for each (x1, y1, x2, y2, detect_width) request"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            x1, y1, x2, y2, detect_width = request
+            try:
+                locations = detect_face(frame[y1:y2, x1:x2], max_width=detect_width)
+            except Exception as e:
+                # Always answer, or the preview would wait on this request forever
+                print(f"Preview detection failed: {e}")
+                locations = []
+            results.put([
+                (top + y1, right + x1, bottom + y1, left + x1)
+                for top, right, bottom, left in locations
+            ])
+    finally:
+        del frame
+        shm.close()
+
+
+# Detector process restarts before preview detection falls back to running inline
+PREVIEW_DETECTOR_MAX_RESTARTS = 3
+
+
+class PreviewFaceDetector:
+    """
+    Runs preview detection in a separate process so HOG never stalls the preview
+    (or contends for the GIL). Frames go through shared memory, one request at a time
+    """
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.pending = False
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self._frame = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._proc = None
+        self._restarts = 0
+        self._inline_result = None
+        self._start()
+
+    def _start(self):
+        # Spawn, not fork: a CUDA context (cnn model) doesn't survive fork
+        ctx = mp.get_context('spawn')
+        self._requests = ctx.Queue()
+        self._results = ctx.Queue()
+        self._proc = ctx.Process(
+            target=_preview_detect_worker,
+            args=(self._shm.name, self.shape, self._requests, self._results),
+            daemon=True,
+        )
+        self._proc.start()
+
+    def submit(self, frame, roi, detect_width):
+        """Start detecting in roi (x1, y1, x2, y2) of frame; only call while not pending"""
+        if self._proc is None:
+            # Worker gave up: detect here (blocks the preview, but keeps it working)
+            x1, y1, x2, y2 = roi
+            self._inline_result = [
+                (top + y1, right + x1, bottom + y1, left + x1)
+                for top, right, bottom, left in detect_face(frame[y1:y2, x1:x2], max_width=detect_width)
+            ]
+            self.pending = True
+            return
+        # The worker only reads the shared frame while a request is pending, so this can't tear
+        np.copyto(self._frame, frame)
+        self._requests.put((*roi, detect_width))
+        self.pending = True
+
+    def poll(self):
+        """Face locations (frame coordinates) once the pending request finishes, else None"""
+        if not self.pending:
+            return None
+        if self._proc is None:
+            self.pending = False
+            return self._inline_result
+        try:
+            locations = self._results.get_nowait()
+        except queue.Empty:
+            if not self._proc.is_alive():
+                self._restart()
+            return None
+        self.pending = False
+        return locations
+
+    def _restart(self):
+        """The worker died mid-request: drop the request and start a new one (or go inline)"""
+        self.pending = False
+        self._restarts += 1
+        if self._restarts > PREVIEW_DETECTOR_MAX_RESTARTS:
+            print("Preview detector keeps failing; detecting in the preview loop instead")
+            self._proc = None
+            return
+        print(f"Preview detector exited (code {self._proc.exitcode}); restarting")
+        self._start()
+
+    def close(self):
+        if self._proc is not None:
+            self._requests.put(None)
+            self._proc.join(timeout=2.0)
+            if self._proc.is_alive():
+                self._proc.terminate()
+        del self._frame
+        self._shm.close()
+        self._shm.unlink()
+
+
+def encode_known_location(rgb_frame, face_location, num_jitters=1):
+    """
+    Encode the face at an already detected location, or None
+    num_jitters: resampled passes averaged into the encoding (each one is a full ResNet pass)
+    """
+    encodings = face_recognition.face_encodings(
+        rgb_frame, [face_location], num_jitters=num_jitters, model=LANDMARK_MODEL
+    )
+    return encodings[0] if encodings else None
+
+
+def encode_face_from_frame(frame):
+    """
+    Detect and encode face from a frame
+    Returns (encoding, face_location) or (None, None) if no face found
+    """
+    face_locations = detect_face(frame)
     if not face_locations:
         return None, None
 
     # Get encoding for the first (largest) face
-    encodings = face_recognition.face_encodings(rgb_frame, face_locations, num_jitters=2)
-
-    if not encodings:
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    encoding = encode_known_location(rgb_frame, face_locations[0])
+    if encoding is None:
         return None, None
 
-    return encodings[0], face_locations[0]
+    return encoding, face_locations[0]
 
 
-def upload_face_to_supabase(name, encoding, user_id):
-    """Upload face encoding to Supabase familiar_faces table"""
+# Local backup photos: quality 90 is about a third smaller than OpenCV's default 95
+BACKUP_JPEG_QUALITY = 90
+
+
+def save_jpeg(filename, frame, quality=BACKUP_JPEG_QUALITY):
+    """Encode frame as JPEG and write it to filename"""
+    ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        print(f"Could not encode {filename}")
+        return
+    with open(filename, 'wb') as f:
+        f.write(buf.tobytes())
+
+
+def face_row(name, encoding, user_id):
+    """familiar_faces row for one encoding (same columns the API writes)"""
+    return {
+        "user_id": user_id,
+        "name": name,
+        "encoding_bin": match.encoding_to_bytea(encoding),
+        "embedding": encoding.tolist(),
+    }
+
+
+def upload_faces_to_supabase(rows):
+    """Insert familiar_faces rows in one request; returns True on success"""
     sb = _get_supabase()
     if not sb:
         print("Supabase not available")
         return False
 
     try:
-        sb.table("familiar_faces").insert({
-            "user_id": user_id,
-            "name": name,
-            "encoding": encoding.tolist(),
-        }).execute()
+        sb.table("familiar_faces").insert(rows).execute()
         return True
     except Exception as e:
         print(f"Upload failed: {e}")
         return False
 
 
+def upload_face_to_supabase(name, encoding, user_id):
+    """Upload face encoding to Supabase familiar_faces table"""
+    return upload_faces_to_supabase([face_row(name, encoding, user_id)])
+
+
+BANNER_HEIGHT = 100
+
+
+@lru_cache(maxsize=32)
+def render_banner(width, count_text, status_text, status_color, suggestion):
+    """Top banner (black strip plus text) rasterized once per distinct content"""
+    banner = np.zeros((BANNER_HEIGHT, width, 3), dtype=np.uint8)
+
+    # Photo count
+    cv2.putText(banner, count_text, (10, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    # Status
+    cv2.putText(banner, status_text, (10, 60),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 2)
+
+    # Suggestion
+    cv2.putText(banner, suggestion, (10, 90),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+    return banner
+
+
 def draw_face_box(frame, face_location):
     """Draw a box around detected face"""
     if face_location:
@@ -144,7 +504,12 @@ def draw_face_box(frame, face_location):
     return frame
 
 
-def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None, save_local=False):
+# Ignore SPACE presses this soon after a capture (key repeat would double-capture)
+CAPTURE_DEBOUNCE = 0.3
+
+
+def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None, save_local=False,
+                            num_jitters=1):
     """
     Capture training photos from video stream and upload to Supabase
 
@@ -154,6 +519,7 @@ def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None,
         num_photos: Number of photos/encodings to capture
         stream_url: Video stream URL (defaults to env/Raspberry Pi stream)
         save_local: Also save photos locally for backup
+        num_jitters: Encoding jitter passes per photo (more is slower, slightly more robust)
     """
     if stream_url is None:
         stream_url = DEFAULT_STREAM_URL
@@ -197,7 +563,6 @@ def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None,
         return
 
     count = 0
-    uploaded_count = 0
 
     angles = [
         "Center (straight ahead)",
@@ -211,16 +576,94 @@ def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None,
     print("  Press SPACE to capture when face is detected")
     print("  Press 'q' to finish\n")
 
+    grabber = LatestFrameGrabber(cap)
+    # Encodings are uploaded together once the session ends (one insert, one round trip)
+    pending_rows = []
+    last_capture = 0.0
+    prev_thumb = None
+    face_location = None
+    reused = 0
+    detections = 0
+    frame_idx = 0
+    display_frame = None
+    rgb_frame = None
+    detected_hash = None
+    detector = None
+    # SPACE on a moving scene: the frame waiting for its detection, and whether it was submitted
+    capture_frame = None
+    capture_submitted = False
+    # Local backup writes happen off the preview loop
+    save_pool = ThreadPoolExecutor(max_workers=1) if save_local else None
+
     while count < num_photos:
-        ret, frame = cap.read()
+        ret, frame = grabber.read()
         if not ret:
             print("Failed to read frame, retrying...")
             continue
 
-        display_frame = frame.copy()
+        # Overlays go on a reused buffer; frame stays clean for encoding and the local backup
+        if display_frame is None or display_frame.shape != frame.shape:
+            display_frame = np.empty_like(frame)
+        np.copyto(display_frame, frame)
+        frame_idx += 1
+
+        if detector is None or detector.shape != frame.shape:
+            if detector is not None:
+                detector.close()
+            detector = PreviewFaceDetector(frame.shape)
+            capture_frame = None
+
+        # Pick up the latest finished detection
+        to_encode = None
+        face_locations = detector.poll()
+        if face_locations is not None:
+            face_location = face_locations[0] if face_locations else None
+            if capture_frame is not None:
+                if capture_submitted:
+                    # This result is for the frame SPACE was pressed on
+                    to_encode = (capture_frame, face_location)
+                    capture_frame = None
+                else:
+                    # A preview request was in flight at SPACE; detect on the SPACE frame now
+                    detector.submit(capture_frame, (0, 0, frame.shape[1], frame.shape[0]), PREVIEW_DETECT_WIDTH)
+                    capture_submitted = True
+
+        # Skip detection while nothing moves
+        thumb = cv2.cvtColor(cv2.resize(frame, (160, 120), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        thumb_hash = thumb_dhash(thumb)
+        static = (
+            prev_thumb is not None
+            and reused < STATIC_MAX_REUSE
+            and (
+                mean_abs_diff(thumb, prev_thumb) < STATIC_DIFF_THRESHOLD
+                or bin(thumb_hash ^ detected_hash).count('1') < STATIC_HASH_DISTANCE
+            )
+        )
+
+        if static:
+            reused += 1
+        elif frame_idx % PREVIEW_DETECT_EVERY or detector.pending:
+            # Between preview detections: keep the last box, compare against the last detected frame
+            thumb = prev_thumb
+        else:
+            # Detect face for preview (downscaled, locations only; encoding waits for SPACE)
+            roi = None
+            if prev_thumb is not None and detections % FULL_DETECT_EVERY:
+                roi = motion_roi(thumb, prev_thumb, frame.shape, face_location)
+
+            detect_width = PREVIEW_DETECT_WIDTH
+            if roi is None:
+                roi = (0, 0, frame.shape[1], frame.shape[0])
+            else:
+                x1, y1, x2, y2 = roi
+                # Same downscale factor as a full-frame detection
+                detect_width = max(1, PREVIEW_DETECT_WIDTH * (x2 - x1) // frame.shape[1])
 
-        # Detect face for preview
-        _, face_location = encode_face_from_frame(frame)
+            detector.submit(frame, roi, detect_width)
+            reused = 0
+            detections += 1
+            detected_hash = thumb_hash
+        prev_thumb = thumb
 
         # Draw face box if detected
         if face_location:
@@ -231,68 +674,83 @@ def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None,
             status_color = (0, 0, 255)
             status_text = "No face - adjust position"
 
-        # Top banner
-        cv2.rectangle(display_frame, (0, 0), (display_frame.shape[1], 100), (0, 0, 0), -1)
-
-        # Photo count
-        cv2.putText(display_frame, f"Photos: {count}/{num_photos}", (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-
-        # Status
-        cv2.putText(display_frame, status_text, (10, 60),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 2)
-
-        # Suggestion
+        # Top banner (only re-rendered when its text changes)
         if count < len(angles):
             suggestion = f"Try: {angles[count]}"
         else:
             suggestion = "Keep varying angle"
-        cv2.putText(display_frame, suggestion, (10, 90),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+        banner = render_banner(display_frame.shape[1], f"Photos: {count}/{num_photos}",
+                               status_text, status_color, suggestion)
+        rows = min(BANNER_HEIGHT, display_frame.shape[0])
+        np.copyto(display_frame[:rows], banner[:rows])
 
         cv2.imshow('Face Capture - Remote Stream', display_frame)
 
         key = cv2.waitKey(1) & 0xFF
 
         if key == ord(' '):  # Space bar
-            if face_location is None:
-                print("No face detected - move closer or adjust lighting")
-                continue
-
-            # Get face encoding
-            encoding, _ = encode_face_from_frame(frame)
-
-            if encoding is None:
-                print("Could not encode face - try again")
+            if time.monotonic() - last_capture < CAPTURE_DEBOUNCE or capture_frame is not None:
                 continue
+            if static:
+                # Nothing moved since the last detection, so its box fits this frame
+                to_encode = (frame, face_location)
+            else:
+                # Detect on this exact frame in the detector process; encode when the result arrives
+                capture_frame = frame
+                capture_submitted = not detector.pending
+                if capture_submitted:
+                    detector.submit(frame, (0, 0, frame.shape[1], frame.shape[0]), PREVIEW_DETECT_WIDTH)
 
-            count += 1
+        elif key == ord('q'):
+            break
 
-            # Upload to Supabase
-            if user_id:
-                if upload_face_to_supabase(person_name, encoding, user_id):
-                    uploaded_count += 1
-                    print(f"[{count:2d}/{num_photos}] Captured & uploaded!")
-                else:
-                    print(f"[{count:2d}/{num_photos}] Captured (upload failed)")
-            else:
-                print(f"[{count:2d}/{num_photos}] Captured (no user_id for upload)")
+        if to_encode is None:
+            continue
+        capture, location = to_encode
+        if location is None:
+            print("No face detected - move closer or adjust lighting")
+            continue
 
-            # Optional local save
-            if save_local and output_dir:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"{output_dir}/photo_{count:02d}_{timestamp}.jpg"
-                cv2.imwrite(filename, frame)
+        # Encode the face found in the captured frame at full resolution
+        if rgb_frame is None or rgb_frame.shape != capture.shape:
+            rgb_frame = np.empty_like(capture)
+        cv2.cvtColor(capture, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+        encoding = encode_known_location(rgb_frame, location, num_jitters)
 
-            # Brief pause to avoid double-capture
-            cv2.waitKey(300)
+        if encoding is None:
+            print("Could not encode face - try again")
+            continue
 
-        elif key == ord('q'):
-            break
+        count += 1
+        last_capture = time.monotonic()
 
-    cap.release()
+        # Upload to Supabase
+        if user_id:
+            pending_rows.append(face_row(person_name, encoding, user_id))
+            print(f"[{count:2d}/{num_photos}] Captured!")
+        else:
+            print(f"[{count:2d}/{num_photos}] Captured (no user_id for upload)")
+
+        # Optional local save
+        if save_local and output_dir:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{output_dir}/photo_{count:02d}_{timestamp}.jpg"
+            # grabber.read() hands out a new array per frame and frames aren't drawn on, so no copy
+            save_pool.submit(save_jpeg, filename, capture)
+
+    grabber.release()
+    if detector is not None:
+        detector.close()
+    if save_pool is not None:
+        save_pool.shutdown(wait=True)
     cv2.destroyAllWindows()
 
+    uploaded_count = 0
+    if pending_rows:
+        print(f"Uploading {len(pending_rows)} encodings...")
+        if upload_faces_to_supabase(pending_rows):
+            uploaded_count = len(pending_rows)
+
     print("\n" + "="*70)
     print("CAPTURE COMPLETE")
     print("="*70)
@@ -304,6 +762,11 @@ def capture_training_photos(person_name, user_id, num_photos=5, stream_url=None,
     print("="*70 + "\n")
 
 
+# Buffered-frame drain before a single capture: stop once a grab blocks this long
+DRAIN_LIVE_GRAB = 0.005
+DRAIN_MAX_GRABS = 30
+
+
 def capture_single_photo(person_name, user_id, stream_url=None):
     """
     Quick capture: Take a single photo and upload to Supabase
@@ -312,16 +775,25 @@ def capture_single_photo(person_name, user_id, stream_url=None):
     if stream_url is None:
         stream_url = DEFAULT_STREAM_URL
 
+    # Connect to Supabase while the stream opens, so the upload below skips the handshake
+    sb = _get_supabase()
+    if sb:
+        threading.Thread(target=_warm_supabase, args=(sb,), daemon=True).start()
     cap = open_video_stream(stream_url)
 
     if not cap.isOpened():
         return {"ok": False, "error": "Cannot open video stream"}
 
-    # Capture a few frames to let camera adjust
+    # Let the camera adjust, then drain buffered frames: grab() skips the BGR conversion,
+    # and a grab that has to wait means the next frame is live
     for _ in range(5):
-        cap.read()
+        cap.grab()
+    for _ in range(DRAIN_MAX_GRABS):
+        started = time.monotonic()
+        if not cap.grab() or time.monotonic() - started > DRAIN_LIVE_GRAB:
+            break
 
-    ret, frame = cap.read()
+    ret, frame = cap.retrieve()
     cap.release()
 
     if not ret:
@@ -355,6 +827,9 @@ def list_familiar_faces(user_id):
         return []
 
 
+PHOTO_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+
+
 def review_photos(person_name):
     """
     Review captured photos (local backup only)
@@ -365,7 +840,14 @@ def review_photos(person_name):
         print(f"Folder not found: {folder}")
         return
 
-    photos = [f for f in os.listdir(folder) if f.endswith(('.jpg', '.jpeg', '.png'))]
+    # Newest first
+    with os.scandir(folder) as entries:
+        photos = [
+            e for e in entries
+            if e.is_file() and e.name.rpartition('.')[2].lower() in PHOTO_EXTENSIONS
+        ]
+    photos.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    photos = [e.name for e in photos]
 
     if not photos:
         print(f"No photos found in {folder}")
@@ -437,7 +919,7 @@ def test_stream_connection(stream_url=None):
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print("\nUsage:")
-        print("  python webcam_capture.py <person_name> [num_photos] [--local]")
+        print("  python webcam_capture.py <person_name> [num_photos] [--local] [--jitters N]")
         print("  python webcam_capture.py --test              # Test stream connection")
         print("  python webcam_capture.py --list <user_id>    # List familiar faces")
         print("\nExamples:")
@@ -493,6 +975,7 @@ if __name__ == '__main__':
             user_id = input("Enter Supabase user ID: ").strip()
 
         save_local = input("Save local backup? (y/n, default n): ").strip().lower() == 'y'
+        num_jitters = 1
 
     else:
         if sys.argv[1] == '--test':
@@ -514,9 +997,14 @@ if __name__ == '__main__':
         num_photos = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else 5
         user_id = os.getenv("SUPABASE_USER_ID")
         save_local = '--local' in sys.argv
+        num_jitters = 1
+        if '--jitters' in sys.argv:
+            idx = sys.argv.index('--jitters')
+            if idx + 1 < len(sys.argv) and sys.argv[idx + 1].isdigit():
+                num_jitters = int(sys.argv[idx + 1])
 
     # Capture photos
-    capture_training_photos(person_name, user_id, num_photos, save_local=save_local)
+    capture_training_photos(person_name, user_id, num_photos, save_local=save_local, num_jitters=num_jitters)
 
     # Offer review if local copies exist
     if save_local:
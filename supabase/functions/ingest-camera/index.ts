@@ -25,7 +25,13 @@ serve(async (req) => {
     return new Response("Bad JSON", { status: 400 });
   }
 
-  const { device_id, motion, ultra_close, distance_cm, alert_type } = body;
+  const { device_id, motion, ultra_close, distance_cm, alert_type, alert_types } = body;
+  // One request can carry every face alert from a frame; alert_type is the single-alert form
+  const alertTypes: string[] = Array.isArray(alert_types)
+    ? alert_types
+    : alert_type
+      ? [alert_type]
+      : [];
 
   if (typeof device_id !== "string") {
     return new Response("device_id must be string", { status: 400 });
@@ -51,7 +57,7 @@ serve(async (req) => {
     const expoTokens = (tokens ?? []).map((row) => row.token).filter(Boolean);
 
     if (expoTokens.length) {
-      const isUnknownFace = alert_type === "unknown_face";
+      const isUnknownFace = alertTypes.includes("unknown_face");
       const title = isUnknownFace ? "Unknown face detected" : "Motion detected";
       const bodyText = isUnknownFace
         ? `Unknown face on ${device_id}`
@@ -0,0 +1,12 @@
+-- Alert counts for /api/alerts/stats in a single round-trip
+CREATE OR REPLACE FUNCTION alert_stats(uid UUID)
+RETURNS TABLE (total BIGINT, unknown BIGINT, high BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        COUNT(*),
+        COUNT(*) FILTER (WHERE is_known = FALSE),
+        COUNT(*) FILTER (WHERE threat_level = 'HIGH')
+    FROM alert_logs
+    WHERE user_id = uid;
+$$;
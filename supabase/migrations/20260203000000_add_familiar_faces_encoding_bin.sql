@@ -0,0 +1,16 @@
+-- Store face encodings as raw float32 bytes (512 bytes/row) instead of a JSON
+-- list of doubles. Bytes are big-endian (float4send order) so existing rows
+-- can be converted here; readers fall back to the jsonb column when unset.
+ALTER TABLE familiar_faces ADD COLUMN IF NOT EXISTS encoding_bin BYTEA;
+ALTER TABLE familiar_faces ALTER COLUMN encoding DROP NOT NULL;
+
+UPDATE familiar_faces f
+SET encoding_bin = (
+    SELECT string_agg(float4send(e.value::text::real), ''::bytea ORDER BY e.ord)
+    FROM jsonb_array_elements(f.encoding) WITH ORDINALITY AS e(value, ord)
+)
+WHERE f.encoding_bin IS NULL AND f.encoding IS NOT NULL;
+
+ALTER TABLE familiar_faces
+    ADD CONSTRAINT familiar_faces_encoding_present
+    CHECK (encoding IS NOT NULL OR encoding_bin IS NOT NULL);
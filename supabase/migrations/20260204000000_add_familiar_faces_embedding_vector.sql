@@ -0,0 +1,28 @@
+-- pgvector copy of each face encoding so /api/faces/match can find the
+-- nearest familiar face in Postgres instead of pulling every row
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE familiar_faces ADD COLUMN IF NOT EXISTS embedding vector(128);
+
+UPDATE familiar_faces
+SET embedding = (encoding::text)::vector(128)
+WHERE embedding IS NULL AND encoding IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS familiar_faces_embedding_idx
+    ON familiar_faces USING ivfflat (embedding vector_l2_ops) WITH (lists = 100);
+
+-- Nearest familiar face for a user within max_distance (L2).
+-- Iterative scan keeps the ivfflat index from dropping rows to the user_id filter.
+CREATE OR REPLACE FUNCTION match_familiar_face(uid UUID, probe vector(128), max_distance REAL DEFAULT 0.5)
+RETURNS TABLE (id UUID, name TEXT, distance REAL)
+LANGUAGE sql STABLE
+SET ivfflat.iterative_scan = 'relaxed_order'
+AS $$
+    SELECT f.id, f.name, (f.embedding <-> probe)::real AS distance
+    FROM familiar_faces f
+    WHERE f.user_id = uid
+      AND f.embedding IS NOT NULL
+      AND f.embedding <-> probe < max_distance
+    ORDER BY f.embedding <-> probe
+    LIMIT 1;
+$$;
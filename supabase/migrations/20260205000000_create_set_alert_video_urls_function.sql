@@ -0,0 +1,11 @@
+-- Batched video_url updates from the camera backend in a single round-trip.
+-- A plain UPDATE: alerts deleted while their clip was uploading stay deleted.
+CREATE OR REPLACE FUNCTION set_alert_video_urls(rows JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE alert_logs a
+    SET video_url = r.video_url
+    FROM jsonb_to_recordset(rows) AS r(id UUID, video_url TEXT)
+    WHERE a.id = r.id;
+$$;